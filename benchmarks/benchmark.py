@@ -0,0 +1,305 @@
+"""
+Micro-benchmarks for the hot paths of the poll data model and of rendering results.
+
+Generates synthetic polls of configurable size and prints the timings as JSON, so that runs can be compared.
+Run this from the repository root, e.g.: python -m benchmarks.benchmark --days 60 --voters 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable
+
+from telegram import User
+from telegram.ext import ApplicationBuilder
+
+import bot
+from src import scoring, webapp_server
+from src.shared import Event, EventVote, VoteType, next_version, shared_context
+from src.storage import PickleStorage, Storage
+
+# Bot token and user used for the benchmark. The bot never connects to Telegram.
+BENCHMARK_TOKEN = "123456:benchmark"
+BENCHMARK_BOT_USER = User(id=123456, first_name="Dayfinder", is_bot=True, username="dayfinderbot")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Runs micro-benchmarks for the poll data model and rendering paths, "
+        "printing the results as JSON."
+    )
+    parser.add_argument("--days", type=int, default=60, help="The number of days per poll.")
+    parser.add_argument("--voters", type=int, default=500, help="The number of voters per poll.")
+    parser.add_argument(
+        "--mix",
+        type=float,
+        nargs=3,
+        metavar=("YES", "MAYBE", "NO"),
+        default=[0.5, 0.2, 0.3],
+        help="The relative frequencies of yes, maybe and no votes.",
+    )
+    parser.add_argument(
+        "--polls",
+        type=int,
+        default=100,
+        help="The number of polls stored when benchmarking persistence flushes.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="How often each benchmark is repeated."
+    )
+    parser.add_argument(
+        "--offload-threshold",
+        type=int,
+        default=1000,
+        help="The number of votes from which requests are handled in a worker thread (see bot.py --help).",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The seed for generating polls.")
+    parser.add_argument(
+        "--output", type=str, help="A file to write the results to, instead of stdout."
+    )
+    return parser.parse_args()
+
+
+def generate_poll(
+    rng: random.Random, num_days: int, num_voters: int, mix: list[float], owner_id: int = 1
+) -> Event:
+    """
+    Generates a synthetic poll with the given number of days and voters.
+    :param rng: The random number generator to use.
+    :param num_days: The number of days of the poll.
+    :param num_voters: The number of votes cast on the poll.
+    :param mix: The relative frequencies of yes, maybe and no votes.
+    :param owner_id: The Telegram ID of the poll's owner.
+    :return: The generated poll.
+    """
+    start = date(2024, 1, 1)
+    event = Event(
+        title=f"Benchmark poll {rng.randrange(1_000_000)}",
+        owner_id=owner_id,
+        days=[(start + timedelta(days=i)).isoformat() for i in range(num_days)],
+        notify=False,
+        anonymous=False,
+        description="A synthetic poll generated for benchmarking.",
+    )
+    vote_types = [VoteType.yes, VoteType.maybe, VoteType.no]
+    for user_id in range(num_voters):
+        choices = rng.choices(vote_types, weights=mix, k=num_days)
+        event.add_vote(
+            EventVote(
+                user_id=1000 + user_id,
+                user_name=f"Voter {user_id}",
+                vote=dict(zip(event.days, choices)),
+            )
+        )
+    return event
+
+
+async def measure(
+    repeat: int, function: Callable[[], Any | Awaitable[Any]], setup: Callable[[], None] = lambda: None
+) -> dict[str, float]:
+    """
+    Runs the given function `repeat` times and returns statistics about its run time in milliseconds.
+    :param repeat: How often to run the function.
+    :param function: The function to run. If it returns an awaitable, it is awaited.
+    :param setup: A function that is run (untimed) before each run, e.g., to clear caches.
+    :return: The minimum, median, mean and maximum run time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        result = function()
+        if asyncio.iscoroutine(result):
+            await result
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "max_ms": max(timings),
+    }
+
+
+async def max_loop_block(function: Callable[[], Awaitable[Any]]) -> float:
+    """
+    Runs the given function and measures for how long it blocked the event loop at most.
+    :param function: The function to run.
+    :return: The longest time (in milliseconds) during which the event loop could not run other tasks.
+    """
+    gaps = []
+    done = False
+
+    async def tick():
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0)
+    await function()
+    done = True
+    await ticker
+    return max(gaps) * 1000
+
+
+def clear_best_days(event: Event):
+    # The cached result is only reset by changes to the poll, so we need to reset it manually here.
+    event._best_days = None
+
+
+async def run_benchmarks(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    app = ApplicationBuilder().token(BENCHMARK_TOKEN).build()
+    # Normally set by initialize(), which would contact Telegram.
+    app.bot._bot_user = BENCHMARK_BOT_USER
+    app.bot_data["events"] = {}
+    shared_context.telegram_app = app
+    shared_context.storage = Storage()
+    shared_context.args = argparse.Namespace(
+        offload_threshold=args.offload_threshold,
+        score_weights=[1.0, 0.5, 0.0],
+        window_lengths=[2, 3],
+    )
+
+    event = generate_poll(rng, args.days, args.voters, args.mix)
+    shared_context.add_event(event)
+    poll_id = str(event.id)
+    repeat = args.repeat
+    results: dict[str, Any] = {}
+
+    results["event_best_days_uncached"] = await measure(
+        repeat, event.best_days, lambda: clear_best_days(event)
+    )
+    results["event_best_days_cached"] = await measure(repeat, event.best_days)
+    results["event_day_votes_all_days"] = await measure(
+        repeat, lambda: [event.day_votes(day, VoteType.yes) for day in event.days]
+    )
+    results["event_rebuild_indexes"] = await measure(repeat, event.rebuild_indexes)
+    results[f"compute_scores_{'numpy' if scoring.numpy is not None else 'python'}"] = await measure(
+        repeat,
+        lambda: scoring.compute_scores(
+            event, scoring.ScoringWeights(), shared_context.args.window_lengths
+        ),
+    )
+
+    results["get_result_text_uncached"] = await measure(
+        repeat,
+        lambda: bot.get_result_text(poll_id),
+        lambda: (
+            bot.result_text_cache.invalidate(poll_id),
+            scoring.scores_cache.invalidate(poll_id),
+            clear_best_days(event),
+        ),
+    )
+    results["get_result_text_cached"] = await measure(
+        repeat, lambda: bot.get_result_text(poll_id)
+    )
+    owner_key = (poll_id, True)
+    results["get_inline_query_results_uncached"] = await measure(
+        repeat,
+        lambda: bot.get_inline_query_results(event, BENCHMARK_BOT_USER.username, event.owner_id),
+        lambda: (
+            bot.inline_results_cache.invalidate(owner_key),
+            bot.result_text_cache.invalidate(poll_id),
+            scoring.scores_cache.invalidate(poll_id),
+        ),
+    )
+    results["get_inline_query_results_cached"] = await measure(
+        repeat,
+        lambda: bot.get_inline_query_results(event, BENCHMARK_BOT_USER.username, event.owner_id),
+    )
+
+    client = webapp_server.webapp.test_client()
+    for name, page, url in (
+        ("results_page", "results", f"/results?poll_id={poll_id}"),
+        ("results_data", "results-data", f"/poll/results?poll_id={poll_id}"),
+        ("vote_page", "vote", f"/vote?tgWebAppStartParam={poll_id}"),
+    ):
+        response = await client.get(url)
+        body = await response.get_data()
+        results[f"{name}_size_bytes"] = len(body)
+        results[f"{name}_uncached"] = await measure(
+            repeat,
+            lambda: client.get(url),
+            lambda: (
+                webapp_server.page_cache.invalidate((page, poll_id)),
+                scoring.scores_cache.invalidate(poll_id),
+            ),
+        )
+        results[f"{name}_cached"] = await measure(repeat, lambda: client.get(url))
+        etag = response.headers["ETag"]
+        results[f"{name}_not_modified"] = await measure(
+            repeat, lambda: client.get(url, headers={"If-None-Match": etag})
+        )
+
+    voters_url = f"/poll/voters?poll_id={poll_id}&day={event.days[0]}&type=yes"
+    results["voters_page"] = await measure(repeat, lambda: client.get(voters_url))
+
+    # For persistence, we store a number of polls of the same size and flush them all.
+    for owner_id in range(1, args.polls):
+        shared_context.add_event(
+            generate_poll(rng, args.days, args.voters, args.mix, owner_id=owner_id)
+        )
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "persistence.pickle")
+        storage = PickleStorage(filepath, os.path.join(directory, "archive"))
+        flush_repeat = max(1, repeat // 4)
+
+        results["pickle_storage_flush_all_changed"] = await measure(
+            flush_repeat, storage.flush, lambda: storage._snapshots.clear()
+        )
+
+        def change_one_poll():
+            # Changing a poll increases its version, so it needs to be copied again.
+            event.version = next_version()
+
+        results["pickle_storage_flush_one_changed"] = await measure(
+            flush_repeat, storage.flush, change_one_poll
+        )
+        change_one_poll()
+        results["pickle_storage_flush_one_changed_loop_block_ms"] = await max_loop_block(storage.flush)
+        storage._snapshots.clear()
+        results["pickle_storage_flush_all_changed_loop_block_ms"] = await max_loop_block(storage.flush)
+        results["pickle_storage_size_bytes"] = os.path.getsize(filepath)
+
+    return results
+
+
+async def main():
+    args = parse_arguments()
+    results = await run_benchmarks(args)
+    output = {
+        "parameters": {
+            "days": args.days,
+            "voters": args.voters,
+            "mix": args.mix,
+            "polls": args.polls,
+            "offload_threshold": args.offload_threshold,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,511 @@
+"""
+Load test for the web server and bot, run against a local stand-in for the Telegram Bot API.
+
+Starts Dayfinder (i.e., `main()` in bot.py) in a subprocess whose Bot API requests go to a fake Bot API served by
+this script, so that no requests ever reach Telegram. Synthetic users with correctly signed `initData` then
+concurrently create polls, vote on them, fetch their results and send inline queries (which are delivered to the bot
+via the fake Bot API's getUpdates). Throughput, latency percentiles and error rates are printed as JSON.
+Run this from the repository root, e.g.: python -m benchmarks.loadtest --users 2000 --duration 30
+Arguments after "--" are passed on to bot.py, e.g.: python -m benchmarks.loadtest -- --storage sqlite
+"""
+import argparse
+import asyncio
+import hmac
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+import httpx
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, request
+
+# Bot token used for the load test. Requests to the Bot API only ever reach the fake Bot API below.
+LOADTEST_TOKEN = "123456:loadtest"
+LOADTEST_BOT_USERNAME = "dayfinderloadtestbot"
+# IDs of the synthetic users start here, so that they don't collide with the bot's ID.
+FIRST_USER_ID = 1_000_000
+OPERATIONS = ("create", "vote", "results", "inline")
+# Poll IDs are taken from the links in the messages the bot sends when a poll has been created.
+POLL_LINK_PATTERN = re.compile(r"startapp=([0-9a-f-]{36})")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Runs a load test against Dayfinder, using a local stand-in for the Telegram Bot API, "
+        "and prints the results as JSON. Arguments after '--' are passed on to bot.py."
+    )
+    parser.add_argument("--users", type=int, default=2000, help="The number of synthetic users.")
+    parser.add_argument(
+        "--polls", type=int, default=50, help="The number of polls created before the load test starts."
+    )
+    parser.add_argument("--days", type=int, default=30, help="The number of days per poll.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=64,
+        help="The number of operations in flight at the same time.",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="How long (in seconds) the load test runs."
+    )
+    parser.add_argument(
+        "--mix",
+        type=float,
+        nargs=4,
+        metavar=("CREATE", "VOTE", "RESULTS", "INLINE"),
+        default=[1, 10, 6, 3],
+        help="The relative frequencies of creating polls, voting, fetching results and sending inline queries.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10,
+        help="The time (in seconds) after which an operation counts as failed.",
+    )
+    parser.add_argument(
+        "--web-port",
+        type=int,
+        help="The port on which to run the web server. By default, a free port is chosen.",
+    )
+    parser.add_argument(
+        "--api-port",
+        type=int,
+        help="The port on which to run the fake Bot API. By default, a free port is chosen.",
+    )
+    parser.add_argument(
+        "--app-log",
+        type=str,
+        help="A file to write the output of bot.py to. By default, it is written to a temporary file "
+        "which is only printed if the app fails to start.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The seed for generating traffic.")
+    parser.add_argument(
+        "--output", type=str, help="A file to write the results to, instead of stdout."
+    )
+    parser.add_argument("app_args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.app_args[:1] == ["--"]:
+        args.app_args = args.app_args[1:]
+    if args.users < 1 or args.polls < 1 or args.days < 1 or args.concurrency < 1:
+        parser.error("--users, --polls, --days and --concurrency must be at least 1.")
+    elif args.polls > args.users:
+        parser.error("--polls must not be larger than --users, as every poll is created by another user.")
+    return args
+
+
+def sign_init_data(token: str, user: dict[str, Any], start_param: Optional[str] = None) -> str:
+    """
+    Generates the `initData` that Telegram would pass to the Mini App for the given user,
+    signed just like `WebAppAuthenticator` in src/auth.py expects.
+    :param token: The bot token with which the data is signed.
+    :param user: The user object to include in the data.
+    :param start_param: The start parameter to include in the data, if any.
+    :return: The URL-encoded `initData`.
+    """
+    # See https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+    data = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"loadtest-{user['id']}",
+        "user": json.dumps(user, separators=(",", ":")),
+    }
+    if start_param is not None:
+        data["start_param"] = start_param
+    data_check_string = "\n".join(f"{key}={data[key]}" for key in sorted(data))
+    secret_key = hmac.digest(b"WebAppData", token.encode(), "sha256")
+    data["hash"] = hmac.digest(secret_key, data_check_string.encode(), "sha256").hex()
+    return urlencode(data)
+
+
+class FakeBotAPI:
+    """
+    A local stand-in for the Telegram Bot API, which records all calls made by the bot.
+    It answers getMe, getUpdates, sendMessage and answerInlineQuery (and acknowledges any other method),
+    and delivers inline queries to the bot via getUpdates.
+    """
+
+    def __init__(self, token: str):
+        """
+        :param token: The bot token which the bot uses in its requests.
+        """
+        self.token = token
+        self.calls: Counter[str] = Counter()
+        self.poll_ids: list[str] = []
+        self._updates: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._inline_queries: dict[str, asyncio.Future] = {}
+        self.app = Quart(__name__)
+        self.app.add_url_rule(
+            "/bot<token>/<method>", view_func=self._handle, methods=["GET", "POST"]
+        )
+
+    async def _handle(self, token: str, method: str):
+        if token != self.token:
+            return {"ok": False, "error_code": 401, "description": "Unauthorized"}, 401
+        self.calls[method] += 1
+        parameters = dict(await request.form)
+        if not parameters:
+            parameters = await request.get_json(silent=True) or {}
+
+        if method == "getMe":
+            result = {
+                "id": int(self.token.split(":")[0]),
+                "is_bot": True,
+                "first_name": "Dayfinder",
+                "username": LOADTEST_BOT_USERNAME,
+            }
+        elif method == "getUpdates":
+            result = await self._get_updates(float(parameters.get("timeout", 0)))
+        elif method == "sendMessage":
+            text = parameters.get("text", "")
+            if text.startswith("Created new poll") and (match := POLL_LINK_PATTERN.search(text)):
+                self.poll_ids.append(match.group(1))
+            result = {
+                "message_id": self.calls[method],
+                "date": int(time.time()),
+                "chat": {"id": int(parameters["chat_id"]), "type": "private"},
+                "text": text,
+            }
+        elif method == "answerInlineQuery":
+            answered = self._inline_queries.pop(parameters.get("inline_query_id"), None)
+            if answered is not None and not answered.done():
+                answered.set_result(json.loads(parameters.get("results", "[]")))
+            result = True
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    async def _get_updates(self, timeout: float) -> list[dict[str, Any]]:
+        """
+        Returns the pending updates, waiting at most `timeout` seconds for the first one (like long polling).
+        """
+        try:
+            updates = [await asyncio.wait_for(self._updates.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self._updates.empty() and len(updates) < 100:
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    async def inline_query(self, user: dict[str, Any], query: str) -> list[dict[str, Any]]:
+        """
+        Sends an inline query to the bot and waits until the bot has answered it.
+        :param user: The user sending the inline query.
+        :param query: The text of the inline query.
+        :return: The results with which the bot answered the inline query.
+        """
+        update_id = next(self._update_ids)
+        query_id = str(update_id)
+        answered = asyncio.get_running_loop().create_future()
+        self._inline_queries[query_id] = answered
+        self._updates.put_nowait(
+            {
+                "update_id": update_id,
+                "inline_query": {
+                    "id": query_id,
+                    "from": {**user, "is_bot": False},
+                    "query": query,
+                    "offset": "",
+                },
+            }
+        )
+        try:
+            return await answered
+        finally:
+            self._inline_queries.pop(query_id, None)
+
+
+class LoadTest:
+    """
+    Drives traffic from synthetic users against the web server and the bot, and records the outcome of each operation.
+    """
+
+    def __init__(self, args: argparse.Namespace, api: FakeBotAPI, client: httpx.AsyncClient):
+        self.args = args
+        self.api = api
+        self.client = client
+        self.rng = random.Random(args.seed)
+        self.users = [
+            {"id": FIRST_USER_ID + i, "first_name": "User", "last_name": str(i)} for i in range(args.users)
+        ]
+        start = date.today() + timedelta(days=1)
+        # All polls share the same days, so that votes can be generated without knowing the poll.
+        self.days = [(start + timedelta(days=i)).isoformat() for i in range(args.days)]
+        # Like in a Mini App session, the same initData is reused by a user for the same poll.
+        self._init_data: dict[tuple[int, Optional[str]], str] = {}
+        # Maps each operation to the latencies (in seconds) and outcomes (HTTP status or error) of its runs.
+        self.latencies: dict[str, list[float]] = {operation: [] for operation in OPERATIONS}
+        self.outcomes: dict[str, Counter[str]] = {operation: Counter() for operation in OPERATIONS}
+
+    def init_data(self, user: dict[str, Any], start_param: Optional[str] = None) -> str:
+        key = (user["id"], start_param)
+        if key not in self._init_data:
+            self._init_data[key] = sign_init_data(LOADTEST_TOKEN, user, start_param)
+        return self._init_data[key]
+
+    async def create(self, user: dict[str, Any]) -> str:
+        response = await self.client.post(
+            "/poll",
+            json={
+                "initData": self.init_data(user),
+                "title": f"Load test poll by {user['last_name']}",
+                "description": "A synthetic poll created by the load test.",
+                "days": self.days,
+                "notification": True,
+                "anonymous": False,
+            },
+        )
+        return str(response.status_code)
+
+    async def vote(self, user: dict[str, Any]) -> str:
+        poll_id = self.rng.choice(self.api.poll_ids)
+        votes = self.rng.choices(["yes", "maybe", "no"], weights=[5, 2, 3], k=len(self.days))
+        response = await self.client.patch(
+            "/poll",
+            json={"initData": self.init_data(user, poll_id), "days": dict(zip(self.days, votes))},
+        )
+        return str(response.status_code)
+
+    async def results(self, user: dict[str, Any]) -> str:
+        poll_id = self.rng.choice(self.api.poll_ids)
+        response = await self.client.get("/poll/results", params={"poll_id": poll_id})
+        return str(response.status_code)
+
+    async def inline(self, user: dict[str, Any]) -> str:
+        # Inline queries either search for a poll by its ID or list the user's own polls.
+        query = self.rng.choice(self.api.poll_ids) if self.rng.random() < 0.5 else ""
+        await self.api.inline_query(user, query)
+        return "answered"
+
+    async def run_operation(self, operation: str, user: dict[str, Any]):
+        start = time.perf_counter()
+        try:
+            outcome = await asyncio.wait_for(getattr(self, operation)(user), self.args.timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        self.latencies[operation].append(time.perf_counter() - start)
+        self.outcomes[operation][outcome] += 1
+
+    async def create_initial_polls(self):
+        """
+        Lets the first `--polls` users create a poll each, and waits until the bot has notified them about it.
+        """
+        owners = self.users[: self.args.polls]
+        await asyncio.gather(*(self.run_operation("create", owner) for owner in owners))
+        # Notifications are rate-limited like for Telegram, so this may take a while for many polls.
+        deadline = time.monotonic() + self.args.timeout + self.args.polls / 10
+        while len(self.api.poll_ids) < self.args.polls:
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"Only {len(self.api.poll_ids)} of {self.args.polls} polls have been created. "
+                    "Check the output of bot.py (see --app-log)."
+                )
+            await asyncio.sleep(0.1)
+
+    async def run(self) -> float:
+        """
+        Runs the mixed workload for `--duration` seconds with `--concurrency` concurrent operations.
+        :return: The time (in seconds) the workload actually took, including finishing the last operations.
+        """
+        deadline = time.perf_counter() + self.args.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                operation = self.rng.choices(OPERATIONS, weights=self.args.mix)[0]
+                await self.run_operation(operation, self.rng.choice(self.users))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return time.perf_counter() - start
+
+    def reset(self):
+        for operation in OPERATIONS:
+            self.latencies[operation].clear()
+            self.outcomes[operation].clear()
+
+    def report(self, elapsed: float) -> dict[str, Any]:
+        results = {}
+        for operation in OPERATIONS + ("total",):
+            if operation == "total":
+                latencies = list(itertools.chain.from_iterable(self.latencies.values()))
+                outcomes = sum(self.outcomes.values(), Counter())
+            else:
+                latencies = self.latencies[operation]
+                outcomes = self.outcomes[operation]
+            errors = sum(count for outcome, count in outcomes.items() if not is_success(outcome))
+            results[operation] = {
+                "requests": len(latencies),
+                "throughput_per_second": len(latencies) / elapsed,
+                "errors": errors,
+                "error_rate": errors / len(latencies) if latencies else 0.0,
+                "outcomes": dict(outcomes),
+                **latency_statistics(latencies),
+            }
+        return results
+
+
+def is_success(outcome: str) -> bool:
+    return outcome == "answered" or (outcome.isdigit() and int(outcome) < 400)
+
+
+def latency_statistics(latencies: list[float]) -> dict[str, float]:
+    """
+    :param latencies: The latencies (in seconds) of a number of operations.
+    :return: The mean, maximum and the 50th, 90th, 95th and 99th percentile of the latencies in milliseconds.
+    """
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    statistics = {"mean_ms": sum(ordered) / len(ordered) * 1000}
+    for percentile in (50, 90, 95, 99):
+        # Nearest-rank method, so that each percentile is an actually observed latency.
+        rank = max(1, -(-percentile * len(ordered) // 100))
+        statistics[f"p{percentile}_ms"] = ordered[rank - 1] * 1000
+    statistics["max_ms"] = ordered[-1] * 1000
+    return statistics
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    """
+    Waits until the web server started in the given process answers requests.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"bot.py exited with code {process.returncode} during startup.")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"bot.py did not start within {timeout} seconds.")
+
+
+async def stop_app(process: subprocess.Popen, timeout: float = 30):
+    """
+    Stops the given process like a user pressing Ctrl+C would, so that pending changes are flushed.
+    """
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.to_thread(process.wait, timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        await asyncio.to_thread(process.wait)
+
+
+async def run_load_test(args: argparse.Namespace, directory: str, log_file) -> dict[str, Any]:
+    api = FakeBotAPI(LOADTEST_TOKEN)
+    api_port = args.api_port or free_port()
+    web_port = args.web_port or free_port()
+    config = Config()
+    config.bind = [f"127.0.0.1:{api_port}"]
+    stop_api = asyncio.Event()
+    api_server = asyncio.create_task(serve(api.app, config, shutdown_trigger=stop_api.wait))
+
+    command = [
+        sys.executable,
+        "bot.py",
+        "--token", LOADTEST_TOKEN,
+        "--bot-api-url", f"http://127.0.0.1:{api_port}/bot",
+        "--web-url", f"http://127.0.0.1:{web_port}",
+        "--web-host", "127.0.0.1",
+        "--web-port", str(web_port),
+        "--persistence-file", os.path.join(directory, "persistence.pickle"),
+        "--sqlite-file", os.path.join(directory, "dayfinder.sqlite3"),
+        "--archive-dir", os.path.join(directory, "archive"),
+        # We want to measure how much load the app can handle, not how well it rejects it.
+        # This can be overridden by passing --rate-limit after "--".
+        "--rate-limit", "0",
+        *args.app_args,
+    ]  # fmt: skip
+    process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{web_port}", limits=limits, timeout=args.timeout
+        ) as client:
+            await wait_until_ready(client, process)
+            load_test = LoadTest(args, api, client)
+            setup_start = time.perf_counter()
+            await load_test.create_initial_polls()
+            setup = load_test.report(time.perf_counter() - setup_start)["create"]
+            load_test.reset()
+            elapsed = await load_test.run()
+            results = load_test.report(elapsed)
+    finally:
+        await stop_app(process)
+        stop_api.set()
+        await api_server
+
+    return {
+        "duration_seconds": elapsed,
+        # The initial polls are created (and waited for) before the actual load test, so they are reported separately.
+        "setup": setup,
+        "operations": results,
+        "bot_api_calls": dict(api.calls),
+        "app_exit_code": process.returncode,
+    }
+
+
+async def main():
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = args.app_log or os.path.join(directory, "bot.log")
+        with open(log_path, "w") as log_file:
+            try:
+                results = await run_load_test(args, directory, log_file)
+            except RuntimeError:
+                if not args.app_log:
+                    with open(log_path) as log:
+                        sys.stderr.write(log.read()[-10_000:])
+                raise
+    output = {
+        "parameters": {
+            "users": args.users,
+            "polls": args.polls,
+            "days": args.days,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": dict(zip(OPERATIONS, args.mix)),
+            "seed": args.seed,
+            "app_args": args.app_args,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 import asyncio
 import html
-import itertools
 import logging
-import pprint
+import multiprocessing
+import signal
+import socket
+import tempfile
 from asyncio import AbstractEventLoop
-from datetime import datetime
+from datetime import datetime, timedelta
 from ssl import SSLError
-from typing import Any
+from typing import Any, Optional
 
 from telegram import (
     Update,
@@ -19,22 +21,46 @@ from telegram import (
     InlineQueryResultArticle,
     InputTextMessageContent,
 )
-from telegram.constants import ParseMode
+from telegram.constants import MessageLimit, ParseMode
 from telegram.error import TimedOut, TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     ContextTypes,
     CommandHandler,
-    PicklePersistence,
     InlineQueryHandler,
     Application,
     filters,
     CallbackQueryHandler,
+    TypeHandler,
 )
 
 from src.arguments import parse_arguments
-from src.shared import shared_context, Event, VoteType
-from src.webapp_server import run_webapp_server, webapp
+from src.auth import WebAppAuthenticator
+from src.cache import VersionedCache
+from src.export import write_export
+from src.metrics import instrument_handler
+from src.notifications import NotificationQueue, GLOBAL_MESSAGES_PER_SECOND
+from src.ratelimit import TokenBucketLimiter
+from src.scoring import get_scores
+from src.shared import shared_context, Event, ProcessRole, VoteType
+from src.storage import PickleStorage, SQLiteStorage, PersistenceScheduler
+from src.webapp_server import run_webapp_server, webapp, WEBHOOK_PATH
+
+# The maximum number of polls listed by /polls.
+MAX_LISTED_POLLS = 20
+# The maximum number of the user's own polls returned for an inline query.
+# Telegram allows at most 50 results per inline query, and we return two results per own poll.
+MAX_INLINE_POLLS = 25
+# The number of top-ranked days listed in the result text.
+MAX_RANKED_DAYS = 3
+
+# How often (in seconds) we check for polls to archive (see --archive-after-days).
+ARCHIVE_INTERVAL = 60 * 60
+
+# Rendered result texts, keyed by poll ID.
+result_text_cache = VersionedCache(max_size=1024)
+# Inline query results, keyed by poll ID and whether they were generated for the poll's owner.
+inline_results_cache = VersionedCache(max_size=1024)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -72,9 +98,12 @@ async def results(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=ReplyKeyboardRemove(),
         )
         return
+    if await shared_context.get_event(context.args[0]) is None:
+        await update.effective_message.reply_text("This poll does not exist (anymore).")
+        return
 
     await update.effective_message.reply_text(
-        get_result_text(context.args[0]),
+        await get_result_text(context.args[0]),
         parse_mode=ParseMode.HTML,
     )
 
@@ -85,19 +114,20 @@ async def polls(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Displays a list of all polls the user has created.
     """
     events = context.bot_data["events"]
-    relevant = sorted(
-        filter(lambda poll: poll.owner_id == update.effective_user.id, events.values()),
-        key=lambda poll: poll.time_created,
-        reverse=True,
-    )
-    if not relevant:
+    num_polls = shared_context.owner_index.count(update.effective_user.id)
+    if num_polls == 0:
         await update.effective_message.reply_text("You have no polls yet.")
         return
 
     text = "Choose a poll whose results you want to see."
-    if len(relevant) > 20:
-        text += "\n\n<i>Only the 20 most recent polls are shown.</i>"
-        relevant = relevant[:20]
+    if num_polls > MAX_LISTED_POLLS:
+        text += f"\n\n<i>Only the {MAX_LISTED_POLLS} most recent polls are shown.</i>"
+    relevant = [
+        events[poll_id]
+        for poll_id in shared_context.owner_index.recent(
+            update.effective_user.id, MAX_LISTED_POLLS
+        )
+    ]
 
     await update.effective_message.reply_text(
         text,
@@ -138,12 +168,12 @@ async def callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Displays the results for the clicked poll.
     """
     query = update.callback_query
-    if query.data not in context.bot_data["events"]:
+    poll = await shared_context.get_event(query.data)
+    if poll is None:
         await query.answer("This poll no longer exists.")
         await query.message.delete()
         return
 
-    poll = context.bot_data["events"][query.data]
     if poll.owner_id != query.from_user.id:
         await query.answer("You are not the owner of this poll.")
         await query.message.delete()
@@ -151,39 +181,93 @@ async def callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await query.answer()
     await query.message.edit_text(
-        text=get_result_text(query.data), parse_mode=ParseMode.HTML
+        text=await get_result_text(query.data), parse_mode=ParseMode.HTML
     )
 
 
-def get_result_text(poll_id: str) -> str:
+async def get_result_text(poll_id: str) -> str:
     """
     Generates the text for the results of the given poll.
     :param poll_id: The ID of the poll for which results shall be generated.
     :return: The text for the results of the given poll.
     """
     poll: Event = shared_context.telegram_app.bot_data["events"][poll_id]
+    # As with the scores, the text is cached for the version we started with, even if the poll changes in between.
+    version = poll.version
+    if (cached := result_text_cache.get(poll_id, version)) is not None:
+        return cached
+
+    scores = await get_scores(poll)
     best_days = poll.best_days()
-    result_text = f"Results for <i>{html.escape(poll.title)}</i>\n\n"
+    header = f"Results for <i>{html.escape(poll.title)}</i>\n\n"
+    day_lines = {}
     for day in poll.days:
         yes_votes = poll.num_votes(day, VoteType.yes)
         maybe_votes = poll.num_votes(day, VoteType.maybe)
         no_votes = poll.num_votes(day, VoteType.no)
+        line = f"{format_day(day)}: {yes_votes} yes, {maybe_votes} maybe, {no_votes} no"
         # We want to make the top options bold
         if day in best_days:
-            result_text += "<b>"
-        parsed_day = datetime.strptime(day, "%Y-%m-%d")
-        result_text += f"{parsed_day.strftime('%d %b %Y')}: {yes_votes} yes, {maybe_votes} maybe, {no_votes} no"
-        if day in best_days:
-            result_text += "</b>"
-        result_text += "\n"
-
-    result_text += (
+            line = f"<b>{line}</b>"
+        day_lines[day] = line + "\n"
+
+    # The full ranking is shown on the results page, here we only list the top days and the best windows.
+    footer = ""
+    top_days = [day for day in scores.ranking[:MAX_RANKED_DAYS] if scores.scores[day] > 0]
+    if top_days:
+        footer += "\nTop days: " + ", ".join(
+            f"{format_day(day)} (score {scores.scores[day]:g})" for day in top_days
+        )
+    for length, windows in scores.windows.items():
+        if windows and windows[0].score > 0:
+            window = windows[0]
+            footer += (
+                f"\nBest {length} consecutive days: {format_day(window.days[0])} – {format_day(window.days[-1])} "
+                f"(score {window.score:g}, {window.available} can make all of them)"
+            )
+    footer += (
         f"\n\n<a href='https://t.me/{shared_context.telegram_app.bot.username}"
         f"/results?startapp={str(poll.id)}'>Click for details</a>"
     )
+
+    # Telegram messages may be at most 4096 characters long (not counting HTML tags, which we count anyway to be safe),
+    # so for long polls, we only list as many of the best-ranked days as fit.
+    budget = MessageLimit.MAX_TEXT_LENGTH - len(header) - len(footer)
+    listed_days = poll.days
+    if sum(map(len, day_lines.values())) > budget:
+        budget -= len(omitted_days_line(len(poll.days)))
+        fitting = set()
+        for day in scores.ranking:
+            budget -= len(day_lines[day])
+            if budget < 0:
+                break
+            fitting.add(day)
+        listed_days = [day for day in poll.days if day in fitting]
+    result_text = header + "".join(day_lines[day] for day in listed_days)
+    if len(listed_days) < len(poll.days):
+        result_text += omitted_days_line(len(poll.days) - len(listed_days))
+    result_text += footer
+    result_text_cache.put(poll_id, version, result_text)
     return result_text
 
 
+def omitted_days_line(num_days: int) -> str:
+    """
+    :param num_days: The number of days that are not listed in a result text.
+    :return: The line noting these days in the result text.
+    """
+    return f"… and {num_days} more {'day' if num_days == 1 else 'days'} (see the details below)\n"
+
+
+def format_day(day: str) -> str:
+    """
+    Formats the given day (in ISO format) for display in messages, e.g., as "01 Jan 2024".
+    :param day: The day to format.
+    :return: The formatted day.
+    """
+    return datetime.strptime(day, "%Y-%m-%d").strftime("%d %b %Y")
+
+
 async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Called when the user sends an inline query.
@@ -193,21 +277,26 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     inline_results = []
     events = context.bot_data["events"]
     if not query:
-        relevant = filter(
-            lambda poll: poll.owner_id == update.effective_user.id, events.values()
-        )
-    elif query in events:
-        relevant = [events[query]]
+        relevant = [
+            events[poll_id]
+            for poll_id in shared_context.owner_index.recent(
+                update.effective_user.id, MAX_INLINE_POLLS
+            )
+        ]
+    elif (poll := await shared_context.get_event(query)) is not None:
+        # The query is the ID of a poll, which may be archived.
+        relevant = [poll]
     else:
-        relevant = filter(
-            lambda poll: query.lower() in poll.title.lower()
-            and poll.owner_id == update.effective_user.id,
-            events.values(),
+        relevant = [
+            events[poll_id]
+            for poll_id in shared_context.search_index.search(
+                update.effective_user.id, query, MAX_INLINE_POLLS
+            )
+        ]
+    for poll in relevant:
+        inline_results += await get_inline_query_results(
+            poll, context.bot.username, update.effective_user.id
         )
-    inline_results += itertools.chain.from_iterable(
-        get_inline_query_results(poll, context.bot.username, update.effective_user.id)
-        for poll in relevant
-    )
 
     await update.inline_query.answer(
         inline_results,
@@ -215,7 +304,7 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-def get_inline_query_results(
+async def get_inline_query_results(
     poll: Event, bot_name: str, user_id: int
 ) -> list[InlineQueryResultArticle]:
     """
@@ -225,6 +314,11 @@ def get_inline_query_results(
     :param user_id: The ID of the user who sent the inline query.
     :return: The inline query results for the given poll.
     """
+    cache_key = (str(poll.id), poll.owner_id == user_id)
+    version = poll.version
+    if (cached := inline_results_cache.get(cache_key, version)) is not None:
+        return cached
+
     result_articles = [
         InlineQueryResultArticle(
             id=str(poll.id) + "-results",
@@ -233,7 +327,7 @@ def get_inline_query_results(
             url=f"https://t.me/{bot_name}/results?startapp={str(poll.id)}",
             hide_url=True,
             input_message_content=InputTextMessageContent(
-                message_text=get_result_text(str(poll.id)),
+                message_text=await get_result_text(str(poll.id)),
                 parse_mode=ParseMode.HTML,
             ),
         ),
@@ -254,23 +348,84 @@ def get_inline_query_results(
             ),
         )
 
+    inline_results_cache.put(cache_key, version, result_articles)
     return result_articles
 
 
 async def dump(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Called when the user sends the /dump command.
-    Sends a dump of the bot's data to the user.
+    Sends an export of all polls in memory to the user, as a gzip-compressed JSON Lines document.
     This should only be callable by admins.
     """
-    pprint.pprint(context.bot_data["events"])
-    try:
-        await update.effective_message.reply_text(str(context.bot_data["events"]))
-    except TelegramError as e:
-        # Message is probably too long.
-        logging.warning(
-            f"Could not send dump to user {update.effective_user.id}: {e.message}"
-        )
+    # We only copy the list of polls here. Serializing and compressing them happens in a separate thread,
+    # so that the bot stays responsive. Votes cast in the meantime may or may not be part of the export.
+    events = list(shared_context.events.values())
+    with tempfile.TemporaryFile() as file:
+        await asyncio.to_thread(write_export, events, file)
+        file.seek(0)
+        try:
+            await update.effective_message.reply_document(
+                file,
+                filename=f"dayfinder-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz",
+                caption=f"Exported {len(events)} polls. Archived polls are not included.",
+            )
+        except TelegramError as e:
+            # The export is probably too large (bots may only send files of up to 50 MB).
+            logging.warning(
+                f"Could not send dump to user {update.effective_user.id}: {e.message}"
+            )
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Called when the user sends the /stats command.
+    Reports aggregate counts over all polls in memory.
+    This should only be callable by admins.
+    """
+    statistics = shared_context.statistics
+    size = shared_context.storage.size()
+    await update.effective_message.reply_text(
+        f"Polls: {statistics.polls}\n"
+        f"Votes: {statistics.votes}\n"
+        f"Voters: {statistics.voters}\n"
+        f"Storage size: {'unknown' if size is None else f'{size / 1024 / 1024:.1f} MiB'}"
+    )
+
+
+async def tiers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Called when the user sends the /tiers command.
+    Reports how many polls are kept in memory and how many are archived (see --archive-after-days).
+    This should only be callable by admins.
+    """
+    await update.effective_message.reply_text(
+        f"Active polls (in memory): {len(shared_context.events)}\n"
+        f"Archived polls (on disk): {shared_context.storage.archived_count()}"
+    )
+
+
+async def archive_stale_polls(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Called every ARCHIVE_INTERVAL seconds if --archive-after-days is specified.
+    Moves all polls which have not been active for that many days to the archive.
+    """
+    shared_context.storage.sync()
+    cutoff = datetime.now() - timedelta(days=shared_context.args.archive_after_days)
+    candidates = [event for event in shared_context.events.values() if event.last_active < cutoff]
+    # Polls may have been viewed in web worker processes (see --web-workers), which only record this in the storage.
+    recorded = shared_context.storage.recorded_activity([str(event.id) for event in candidates])
+    for event in candidates:
+        if (last_active := recorded.get(str(event.id))) is not None:
+            event.last_active = max(event.last_active, last_active)
+    stale = [event for event in candidates if event.last_active < cutoff]
+    # archive_events writes the polls to the archive before yielding to the event loop,
+    # so concurrent requests always find each poll either in memory or in the archive.
+    for event in stale:
+        shared_context.remove_event(str(event.id))
+    await shared_context.persistence.archive_events(stale)
+    if stale:
+        logging.info(f"Archived {len(stale)} polls that have been inactive.")
 
 
 @webapp.before_serving
@@ -279,8 +434,26 @@ async def startup():
     Sets up the Telegram bot.
     """
     await shared_context.telegram_app.initialize()
+    # The Application only calls post_init by itself in run_polling/run_webhook, which we don't use.
+    await post_init(shared_context.telegram_app)
     await shared_context.telegram_app.start()
-    await shared_context.telegram_app.updater.start_polling()
+    if shared_context.role == ProcessRole.web:
+        # Updates are handled by the main process instead.
+        pass
+    elif shared_context.args.webhook:
+        # Updates will be posted to our webhook route, which puts them into the update queue.
+        try:
+            await shared_context.telegram_app.bot.set_webhook(
+                url=f"{shared_context.args.web_url}{WEBHOOK_PATH}",
+                secret_token=shared_context.args.webhook_secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        except TelegramError as e:
+            # This happens, e.g., when testing locally without HTTPS. Updates can still be posted manually.
+            logging.error(f"Could not register webhook: {e.message}")
+    else:
+        await shared_context.telegram_app.updater.start_polling()
+    shared_context.notifications.start()
 
 
 @webapp.after_serving
@@ -289,11 +462,16 @@ async def shutdown():
     Shuts down the Telegram bot.
     """
     try:
-        await shared_context.telegram_app.updater.stop()
+        if shared_context.telegram_app.updater.running:
+            await shared_context.telegram_app.updater.stop()
     except TimedOut:
         # This can be safely ignored. It just means we had to cancel an ongoing request.
         pass
+    await shared_context.notifications.stop()
+    # Any changes that have not been persisted yet must be flushed before we stop.
+    await shared_context.persistence.close()
     await shared_context.telegram_app.stop()
+    await shared_context.storage.close()
 
 
 async def post_init(app: Application):
@@ -302,9 +480,22 @@ async def post_init(app: Application):
     Sets up the bot data.
     :param app: The app that has been initialized.
     """
-    if "events" not in app.bot_data:
-        app.bot_data["events"] = {}
-    await app.update_persistence()
+    await shared_context.storage.load(app)
+    shared_context.rebuild_indexes()
+    shared_context.persistence = PersistenceScheduler(
+        shared_context.storage,
+        max_delay=shared_context.args.persistence_max_delay,
+        max_pending=shared_context.args.persistence_max_pending,
+        strict=shared_context.args.persistence_strict,
+    )
+
+
+async def sync_storage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Called before any other handler in multi-process mode.
+    Applies the changes the web worker processes have made to the polls.
+    """
+    shared_context.storage.sync()
 
 
 def exception_handler(loop: AbstractEventLoop, context: dict[str, Any]):
@@ -341,7 +532,26 @@ async def help_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def main():
+async def run_bot():
+    """
+    Runs only the Telegram bot, without the web server, until SIGINT or SIGTERM is received.
+    Used by the main process in multi-process mode.
+    """
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+    await startup()
+    try:
+        await stop.wait()
+    finally:
+        await shutdown()
+
+
+async def main(socket_fd: Optional[int] = None):
+    """
+    Sets up and runs the parts of Dayfinder belonging to this process's role.
+    :param socket_fd: The file descriptor of the socket on which web worker processes serve the web app.
+    """
     logging.basicConfig(
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         level=logging.INFO if not shared_context.args.debug else logging.DEBUG,
@@ -351,44 +561,131 @@ async def main():
         # httpx is python-telegram-bot's HTTP client library.
         logging.getLogger("httpx").setLevel(logging.WARNING)
 
-    persistence = PicklePersistence(shared_context.args.persistence_file)
+    if shared_context.args.storage == "sqlite":
+        shared_context.storage = SQLiteStorage(
+            shared_context.args.sqlite_file,
+            migrate_from=shared_context.args.persistence_file,
+            shared=shared_context.args.web_workers > 1,
+        )
+    else:
+        shared_context.storage = PickleStorage(
+            shared_context.args.persistence_file, shared_context.args.archive_dir
+        )
+
+    shared_context.authenticator = WebAppAuthenticator(shared_context.args.token)
+    shared_context.notifications = NotificationQueue(
+        coalesce_window=shared_context.args.notification_window,
+        # Notifications are sent by the web workers, which need to share Telegram's rate limit.
+        global_rate=GLOBAL_MESSAGES_PER_SECOND / shared_context.args.web_workers,
+    )
+    if shared_context.args.rate_limit > 0:
+        shared_context.rate_limiter = TokenBucketLimiter(
+            rate=shared_context.args.rate_limit / 60, burst=shared_context.args.rate_limit_burst
+        )
+
     shared_context.telegram_app = (
         ApplicationBuilder()
         .token(shared_context.args.token)
-        .persistence(persistence)
-        .post_init(post_init)
+        .base_url(shared_context.args.bot_api_url)
         .build()
     )
 
     # Register handlers
+    # All callbacks are instrumented, so that their latency is recorded in the metrics.
     handlers = [
-        CommandHandler("start", start, filters=filters.ChatType.PRIVATE),
-        CommandHandler("results", results),
-        CommandHandler("polls", polls),
-        CommandHandler("help", help_text),
-        CallbackQueryHandler(callback_query),
-        InlineQueryHandler(inline_query),
+        CommandHandler(
+            "start", instrument_handler(start), filters=filters.ChatType.PRIVATE
+        ),
+        CommandHandler("results", instrument_handler(results)),
+        CommandHandler("polls", instrument_handler(polls)),
+        CommandHandler("help", instrument_handler(help_text)),
+        CallbackQueryHandler(instrument_handler(callback_query)),
+        InlineQueryHandler(instrument_handler(inline_query)),
     ]
     if shared_context.args.admin_ids is None:
         logging.warning("No admin IDs specified. Admin commands will not be available.")
     else:
-        handlers.append(
-            CommandHandler(
-                "dump",
-                dump,
-                filters=filters.User(user_id=shared_context.args.admin_ids),
-            )
-        )
+        admin_filter = filters.User(user_id=shared_context.args.admin_ids)
+        handlers += [
+            CommandHandler("dump", instrument_handler(dump), filters=admin_filter),
+            CommandHandler("stats", instrument_handler(stats), filters=admin_filter),
+            CommandHandler("tiers", instrument_handler(tiers), filters=admin_filter),
+        ]
 
     for handler in handlers:
         shared_context.telegram_app.add_handler(handler)
+    if shared_context.role == ProcessRole.bot:
+        shared_context.telegram_app.add_handler(TypeHandler(Update, sync_storage), group=-1)
+    if shared_context.args.archive_after_days is not None and shared_context.role != ProcessRole.web:
+        # In multi-process mode, only the main process archives polls. The web workers pick this up via sync.
+        shared_context.telegram_app.job_queue.run_repeating(
+            archive_stale_polls, interval=ARCHIVE_INTERVAL, first=ARCHIVE_INTERVAL
+        )
 
     asyncio.get_event_loop().set_exception_handler(exception_handler)
-    # This next command will run until the server stops.
-    # Afterward, our after_serving hook will stop the bot as well.
-    await run_webapp_server()
+    if shared_context.role == ProcessRole.bot:
+        await run_bot()
+    else:
+        # This next command will run until the server stops.
+        # Afterward, our after_serving hook will stop the bot as well.
+        await run_webapp_server(socket_fd)
+
+
+async def migrate_shared_storage():
+    """
+    Migrates polls into the SQLite database before the processes sharing it are started,
+    so that they don't all try to migrate at once.
+    """
+    storage = SQLiteStorage(
+        shared_context.args.sqlite_file, migrate_from=shared_context.args.persistence_file
+    )
+    await storage.migrate()
+    await storage.close()
+
+
+def run_web_worker(socket_fd: int):
+    """
+    Entry point of the web worker processes in multi-process mode.
+    :param socket_fd: The file descriptor of the socket on which to serve the web app.
+    """
+    shared_context.role = ProcessRole.web
+    asyncio.run(main(socket_fd), debug=shared_context.args.debug)
+
+
+def run_multi_process():
+    """
+    Runs Dayfinder in multi-process mode (see --web-workers):
+    The web app is served by several worker processes sharing one listening socket,
+    while this process only handles Telegram updates. All processes share their polls via the SQLite database.
+    """
+    args = shared_context.args
+    asyncio.run(migrate_shared_storage())
+    server_socket = socket.create_server((args.web_host, args.web_port))
+    # The workers inherit the socket when they are forked.
+    fork_context = multiprocessing.get_context("fork")
+    workers = [
+        fork_context.Process(
+            target=run_web_worker, args=(server_socket.fileno(),), name=f"web-worker-{i}"
+        )
+        for i in range(args.web_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    server_socket.close()
+
+    shared_context.role = ProcessRole.bot
+    try:
+        asyncio.run(main(), debug=args.debug)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
 
 
 if __name__ == "__main__":
     shared_context.args = parse_arguments()
-    asyncio.run(main(), debug=shared_context.args.debug)
+    if shared_context.args.web_workers > 1:
+        run_multi_process()
+    else:
+        asyncio.run(main(), debug=shared_context.args.debug)
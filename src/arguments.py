@@ -1,4 +1,6 @@
 import argparse
+import re
+import secrets
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -18,6 +20,14 @@ def parse_arguments() -> argparse.Namespace:
         required=True,
         help="The Telegram bot token. You can get this from @BotFather.",
     )
+    parser.add_argument(
+        "--bot-api-url",
+        type=str,
+        default="https://api.telegram.org/bot",
+        help="The base URL of the Telegram Bot API, to which the bot token and method name are appended. "
+        "This only needs to be changed when using a local Bot API server, or the stand-in used for load testing "
+        "(see benchmarks/loadtest.py).",
+    )
     parser.add_argument(
         "--web-url",
         type=str,
@@ -67,6 +77,185 @@ def parse_arguments() -> argparse.Namespace:
         help="The path to the file in which to store the bot's persistence data. "
         "This file will be created if it does not exist.",
     )
+    parser.add_argument(
+        "--storage",
+        choices=["pickle", "sqlite"],
+        default="pickle",
+        help="The backend in which polls are stored. "
+        "With 'pickle' (the default), all data is stored in the file given by --persistence-file, "
+        "which is rewritten completely on every change. "
+        "With 'sqlite', polls and votes are stored as separate rows in the database given by --sqlite-file, "
+        "so that only changed rows are written. If that database is empty, "
+        "existing polls are migrated from the file given by --persistence-file.",
+    )
+    parser.add_argument(
+        "--sqlite-file",
+        type=str,
+        default="persistence.sqlite3",
+        help="The path to the SQLite database in which to store polls if --storage is set to 'sqlite'. "
+        "This file will be created if it does not exist.",
+    )
+    parser.add_argument(
+        "--persistence-max-delay",
+        type=float,
+        default=1.0,
+        help="Changes to polls are persisted in batches. "
+        "This is the maximum time (in seconds) a change may wait before its batch is persisted. "
+        "The default is 1 second.",
+    )
+    parser.add_argument(
+        "--persistence-max-pending",
+        type=int,
+        default=100,
+        help="The maximum number of changes to polls that may wait before their batch is persisted. "
+        "The default is 100.",
+    )
+    parser.add_argument(
+        "--persistence-strict",
+        action="store_true",
+        help="If this is set, requests changing polls will only be answered once the change has been persisted. "
+        "Otherwise, up to --persistence-max-delay seconds of changes may be lost if the process crashes.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=60,
+        help="The number of requests per minute each user may make to the web app's API (at /poll) on average. "
+        "Further requests are rejected with 429 Too Many Requests. Note that in multi-process mode "
+        "(see --web-workers), each worker process applies this limit separately. "
+        "The default is 60. Set this to 0 to disable rate limiting.",
+    )
+    parser.add_argument(
+        "--rate-limit-burst",
+        type=int,
+        default=20,
+        help="The number of requests each user may make to the web app's API in a short burst, "
+        "before --rate-limit applies. The default is 20.",
+    )
+    parser.add_argument(
+        "--max-days",
+        type=int,
+        default=366,
+        help="The maximum number of days a poll may have. The default is 366, so that polls can span a whole year. "
+        "If the results message sent via Telegram would exceed Telegram's limit of 4096 characters, it only lists "
+        "as many of the best-ranked days as fit, while the results page always shows all of them.",
+    )
+    parser.add_argument(
+        "--max-title-length",
+        type=int,
+        default=256,
+        help="The maximum length (in characters) of the title of a poll. The default is 256.",
+    )
+    parser.add_argument(
+        "--max-description-length",
+        type=int,
+        default=2048,
+        help="The maximum length (in characters) of the description of a poll. The default is 2048.",
+    )
+    parser.add_argument(
+        "--max-polls-per-owner",
+        type=int,
+        default=500,
+        help="The maximum number of polls a single user may have. Archived polls (see --archive-after-days) "
+        "are not counted. The default is 500.",
+    )
+    parser.add_argument(
+        "--score-weights",
+        type=float,
+        nargs=3,
+        metavar=("YES", "MAYBE", "NO"),
+        default=[1.0, 0.5, 0.0],
+        help="The weights with which yes, maybe and no votes count towards the score of a day. "
+        "Days are ranked by their score in the results, and windows of consecutive days by the sum of their scores. "
+        "The default is 1 for yes, 0.5 for maybe and 0 for no votes.",
+    )
+    parser.add_argument(
+        "--window-lengths",
+        metavar="DAYS",
+        type=int,
+        nargs="+",
+        default=[2, 3],
+        help="The lengths of the windows of consecutive days (e.g., 2 for a weekend trip) for which the best windows "
+        "are shown in the results, if the poll contains such consecutive days. The default is 2 and 3 days.",
+    )
+    parser.add_argument(
+        "--archive-after-days",
+        type=float,
+        required=False,
+        help="If this is specified, polls which have not been created, voted on, or viewed for this many days "
+        "are moved from memory to an archive on disk once per hour. Archived polls are restored as soon as "
+        "someone opens a link to them, but they are not listed by /polls or by inline queries until then. "
+        "By default, polls are never archived.",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        type=str,
+        default="archive",
+        help="The directory in which archived polls (see --archive-after-days) are stored "
+        "if --storage is set to 'pickle'. With 'sqlite', archived polls stay in the database. "
+        "This directory will be created if it does not exist.",
+    )
+    parser.add_argument(
+        "--offload-threshold",
+        type=int,
+        default=1000,
+        help="Requests whose work grows with the number of votes on a poll (such as listing its voters or scoring "
+        "its days) are handled in a worker thread if the poll has at least this many votes, so that they don't block "
+        "other requests. For smaller polls, handing the work to a thread would take longer than the work itself. "
+        "The default is 1000.",
+    )
+    parser.add_argument(
+        "--notification-window",
+        type=float,
+        default=60.0,
+        help="Vote notifications for the same poll are coalesced within windows of this many seconds: "
+        "The first vote is notified immediately, while all further votes within the window "
+        "are summarized in a single message. The default is 60 seconds.",
+    )
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="This will make Telegram send updates to a webhook on the web server (at /telegram/webhook), "
+        "instead of polling for updates. Note that Telegram requires the URL given by --web-url to use HTTPS "
+        "on one of the ports 443, 80, 88, or 8443.",
+    )
+    parser.add_argument(
+        "--webhook-secret",
+        type=str,
+        required=False,
+        help="The secret token Telegram has to send along with updates to the webhook (see --webhook). "
+        "It may only contain the characters A-Z, a-z, 0-9, _ and -. "
+        "If this is not specified, a random token is generated on every start.",
+    )
+    parser.add_argument(
+        "--web-workers",
+        type=int,
+        default=1,
+        help="The number of processes serving the web app. If this is greater than 1, the web app is served by "
+        "that many worker processes sharing the same port, while Telegram updates are handled by the main process. "
+        "All processes share their polls via the SQLite database, so this requires --storage to be set to 'sqlite'. "
+        "The default is 1, i.e., a single process handles everything.",
+    )
+    parser.add_argument(
+        "--enable-metrics",
+        action="store_true",
+        help="This will expose metrics (such as request latencies) in the Prometheus text format "
+        "at the /metrics endpoint of the web server.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        required=False,
+        help="If this is specified, metrics are exposed at the /metrics endpoint of a separate server "
+        "listening on this port (instead of the main web server). Implies --enable-metrics.",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default="127.0.0.1",
+        help="The host on which to run the separate metrics server (see --metrics-port). "
+        "By default, this is set to 127.0.0.1, so that metrics are only accessible locally.",
+    )
     parser.add_argument(
         "--enable-httpx-logging",
         action="store_true",
@@ -91,4 +280,44 @@ def parse_arguments() -> argparse.Namespace:
             "Both --web-certfile and --web-keyfile must be specified if either is specified."
         )
 
+    if args.webhook_secret is None:
+        args.webhook_secret = secrets.token_urlsafe(32)
+    elif not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", args.webhook_secret):
+        parser.error(
+            "--webhook-secret must consist of 1 to 256 of the characters A-Z, a-z, 0-9, _ and -."
+        )
+
+    if args.offload_threshold < 0:
+        parser.error("--offload-threshold must not be negative.")
+    if args.rate_limit < 0:
+        parser.error("--rate-limit must not be negative.")
+    for option in (
+        "rate_limit_burst",
+        "max_days",
+        "max_title_length",
+        "max_description_length",
+        "max_polls_per_owner",
+    ):
+        if getattr(args, option) < 1:
+            parser.error(f"--{option.replace('_', '-')} must be at least 1.")
+
+    if any(length < 2 for length in args.window_lengths):
+        parser.error("--window-lengths must all be at least 2.")
+
+    if args.archive_after_days is not None and args.archive_after_days <= 0:
+        parser.error("--archive-after-days must be positive.")
+
+    if args.metrics_port is not None:
+        args.enable_metrics = True
+
+    if args.web_workers < 1:
+        parser.error("--web-workers must be at least 1.")
+    elif args.web_workers > 1:
+        if args.storage != "sqlite":
+            parser.error("--web-workers requires --storage to be set to 'sqlite'.")
+        if args.webhook:
+            parser.error("--webhook cannot be used together with --web-workers.")
+        if args.enable_metrics:
+            parser.error("--enable-metrics cannot be used together with --web-workers.")
+
     return args
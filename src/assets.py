@@ -0,0 +1,94 @@
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.compression import ENCODINGS, compress
+
+
+@dataclass
+class Asset:
+    """
+    A static file, along with its precompressed variants.
+
+    Attributes:
+        content: The content of the file.
+        mimetype: The MIME type of the file.
+        etag: A hash of the content, which is also part of the file's fingerprinted URL.
+        variants: The compressed content, keyed by content encoding. Only variants smaller than the content are kept.
+    """
+
+    content: bytes
+    mimetype: str
+    etag: str
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+
+class AssetStore:
+    """
+    Provides the static files under fingerprinted paths, which contain a hash of the file's content
+    (e.g., `js/common.0123456789abcdef.js`). As the path changes whenever the file changes,
+    clients may cache the files indefinitely.
+    All files are read and compressed only once, when the store is loaded.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory containing the static files.
+        """
+        self.directory = directory
+        # Maps the paths of the files (relative to the directory) to their fingerprinted paths.
+        self._paths: dict[str, str] = {}
+        # Maps fingerprinted paths to the files.
+        self._assets: dict[str, Asset] = {}
+        self._loaded = False
+
+    def load(self):
+        """
+        Reads (and compresses) all files in the directory. Can be called again to pick up changed files.
+        """
+        paths = {}
+        assets = {}
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                filepath = os.path.join(root, filename)
+                path = os.path.relpath(filepath, self.directory).replace(os.sep, "/")
+                with open(filepath, "rb") as file:
+                    content = file.read()
+                digest = hashlib.sha256(content).hexdigest()[:16]
+                stem, extension = os.path.splitext(path)
+                paths[path] = f"{stem}.{digest}{extension}"
+                asset = Asset(
+                    content=content,
+                    mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    etag=digest,
+                )
+                for encoding in ENCODINGS:
+                    if len(compressed := compress(content, encoding)) < len(content):
+                        asset.variants[encoding] = compressed
+                assets[paths[path]] = asset
+        self._paths = paths
+        self._assets = assets
+        self._loaded = True
+
+    def fingerprinted_path(self, path: str) -> str:
+        """
+        Returns the fingerprinted path of the given file.
+        :param path: The path of the file, relative to the directory (e.g., `js/common.js`).
+        :return: The fingerprinted path of the file.
+        :raises KeyError: If the file does not exist.
+        """
+        if not self._loaded:
+            self.load()
+        return self._paths[path]
+
+    def get(self, fingerprinted_path: str) -> Optional[Asset]:
+        """
+        Returns the file with the given fingerprinted path.
+        :param fingerprinted_path: The fingerprinted path of the file.
+        :return: The file, or None if there is no file with the given fingerprinted path.
+        """
+        if not self._loaded:
+            self.load()
+        return self._assets.get(fingerprinted_path)
@@ -0,0 +1,103 @@
+import datetime
+import hmac
+import json
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+
+class AuthenticationError(Exception):
+    """
+    Raised when the data received by the Telegram webapp could not be authenticated.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class _AuthEntry(NamedTuple):
+    data_check_string: str
+    expires: datetime.datetime
+    user: dict[str, Any]
+
+
+class WebAppAuthenticator:
+    """
+    Authenticates the data (`initData`) received by the Telegram webapp.
+    The secret key is derived from the bot token only once, and successfully validated data is cached
+    (keyed by its hash), so that a Mini App session making several requests only needs to be validated once.
+    Cached entries expire once the data becomes too old to be accepted anyway.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        max_age: datetime.timedelta = datetime.timedelta(minutes=60),
+        max_entries: int = 4096,
+    ):
+        """
+        :param token: The Telegram bot token.
+        :param max_age: The maximum age of data that is still accepted.
+        :param max_entries: The maximum number of validated data entries to cache.
+        """
+        # See https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+        self._secret_key = hmac.digest(b"WebAppData", token.encode(), "sha256")
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._cache: OrderedDict[str, _AuthEntry] = OrderedDict()
+
+    def authenticate(self, init_data: dict[str, list[str]]) -> dict[str, Any]:
+        """
+        Authenticates the data received by the Telegram webapp and returns the user who sent it.
+        :param init_data: The data received by the Telegram webapp.
+        :return: The parsed `user` object contained in the data.
+        :raises AuthenticationError: If the data is invalid or too old.
+        """
+        if "hash" not in init_data or "auth_date" not in init_data:
+            raise AuthenticationError("Invalid data was sent.")
+
+        data_hash = init_data["hash"][0]
+        data_check_string = "\n".join(
+            f"{key}={init_data[key][0]}" for key in sorted(init_data) if key != "hash"
+        )
+        entry = self._cache.get(data_hash)
+        if entry is None or entry.data_check_string != data_check_string:
+            entry = self._validate(data_hash, data_check_string, init_data)
+            self._cache[data_hash] = entry
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(data_hash)
+
+        if datetime.datetime.now() > entry.expires:
+            self._cache.pop(data_hash, None)
+            raise AuthenticationError(
+                f"Sent data is too old (more than {int(self.max_age.total_seconds()) // 60} minutes old)."
+            )
+        return entry.user
+
+    def _validate(
+        self, data_hash: str, data_check_string: str, init_data: dict[str, list[str]]
+    ) -> _AuthEntry:
+        """
+        Cryptographically validates the data received by the Telegram webapp.
+        :param data_hash: The hash sent along with the data.
+        :param data_check_string: The data-check-string built from the data.
+        :param init_data: The data received by the Telegram webapp.
+        :return: The cache entry for the validated data.
+        :raises AuthenticationError: If the data is invalid.
+        """
+        expected = hmac.digest(self._secret_key, data_check_string.encode(), "sha256")
+        try:
+            valid = hmac.compare_digest(expected, bytes.fromhex(data_hash))
+        except ValueError:
+            valid = False
+        if not valid or "user" not in init_data:
+            raise AuthenticationError("Invalid data was sent.")
+
+        timestamp = datetime.datetime.fromtimestamp(int(init_data["auth_date"][0]))
+        return _AuthEntry(
+            data_check_string=data_check_string,
+            expires=timestamp + self.max_age,
+            user=json.loads(init_data["user"][0]),
+        )
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class VersionedCache:
+    """
+    A bounded cache for values derived from polls, evicting the least recently used entries once it is full.
+    Each entry is tagged with the version of the poll it was computed from (see Event.version),
+    so that entries computed from an outdated version of a poll are never returned.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        :param max_size: The maximum number of entries the cache may contain.
+        """
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, tuple[int, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """
+        Returns the cached value for the given key, if it has been computed from the given version.
+        :param key: The key of the value.
+        :param version: The current version of the poll the value is derived from.
+        :return: The cached value, or None if there is no (up-to-date) value for the key.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != version:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, version: int, value: Any):
+        """
+        Caches the given value for the given key.
+        :param key: The key of the value.
+        :param version: The version of the poll the value has been computed from.
+        :param value: The value to cache.
+        """
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """
+        Removes the value for the given key from the cache, if it exists.
+        :param key: The key of the value.
+        """
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,44 @@
+import gzip
+from collections.abc import Container
+from typing import Optional
+
+from werkzeug.datastructures import Accept
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional. Without it, we only use gzip.
+    brotli = None
+
+# The content encodings we can compress with, in the order of our preference.
+ENCODINGS: tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data: bytes, encoding: str, fast: bool = False) -> bytes:
+    """
+    Compresses the given data using the given content encoding.
+    :param data: The data to compress.
+    :param encoding: The content encoding to use, which must be contained in ENCODINGS.
+    :param fast: Whether to use a faster but less effective compression level, as is appropriate for
+    dynamic responses. Otherwise, the highest compression level is used, which is appropriate for data
+    that is compressed once and then sent many times.
+    :return: The compressed data.
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if fast else 11)
+    # We fix the modification time, so that the same data always results in the same bytes.
+    return gzip.compress(data, compresslevel=6 if fast else 9, mtime=0)
+
+
+def choose_encoding(accept_encodings: Accept, available: Container[str]) -> Optional[str]:
+    """
+    Chooses the content encoding with which a response should be sent to the client.
+    :param accept_encodings: The encodings accepted by the client (i.e., its parsed Accept-Encoding header).
+    :param available: The encodings in which the response is available.
+    :return: The encoding the client prefers (or we prefer, in case of a tie), or None to send the response as is.
+    """
+    best_encoding, best_quality = None, 0
+    for encoding in ENCODINGS:
+        if encoding in available and (quality := accept_encodings[encoding]) > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
@@ -0,0 +1,54 @@
+import gzip
+import json
+from typing import BinaryIO, Iterable, Iterator
+
+from src.shared import Event
+
+
+def serialize_event(event: Event) -> dict:
+    """
+    Converts the given poll, along with its votes, into a JSON-serializable dictionary.
+    :param event: The poll to convert.
+    :return: A dictionary containing all persisted attributes of the poll.
+    """
+    return {
+        "id": str(event.id),
+        "title": event.title,
+        "owner_id": event.owner_id,
+        "days": event.days,
+        "notify": event.notify,
+        "anonymous": event.anonymous,
+        "description": event.description,
+        "time_created": event.time_created.isoformat(),
+        "votes": [
+            {
+                "user_id": vote.user_id,
+                "user_name": vote.user_name,
+                "vote": dict(vote.vote),
+                "time_created": vote.time_created.isoformat(),
+            }
+            for vote in event.votes
+        ],
+    }
+
+
+def export_lines(events: Iterable[Event]) -> Iterator[bytes]:
+    """
+    Serializes the given polls one at a time in the JSON Lines format, i.e., one JSON object per line.
+    :param events: The polls to serialize.
+    :return: An iterator over the lines, each encoded as UTF-8 and terminated by a newline.
+    """
+    for event in events:
+        yield json.dumps(serialize_event(event), ensure_ascii=False).encode() + b"\n"
+
+
+def write_export(events: Iterable[Event], file: BinaryIO):
+    """
+    Writes the given polls to the given file as gzip-compressed JSON Lines (see `export_lines`).
+    Only one poll is held in memory in serialized form at a time, so this can be used for any number of polls.
+    :param events: The polls to export.
+    :param file: The binary file to write to.
+    """
+    with gzip.GzipFile(fileobj=file, mode="wb") as compressed:
+        for line in export_lines(events):
+            compressed.write(line)
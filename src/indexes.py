@@ -0,0 +1,248 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.shared import Event
+
+
+class OwnerIndex:
+    """
+    Maps the Telegram IDs of poll owners to the IDs of their polls, ordered by creation time.
+    This allows us to look up the polls of a single user without scanning all polls.
+    """
+
+    def __init__(self):
+        # For each owner, contains a list of (time_created, poll ID) tuples, sorted in ascending order.
+        self._polls: dict[int, list[tuple[datetime, str]]] = {}
+
+    def rebuild(self, events: Iterable["Event"]):
+        """
+        Rebuilds the index from scratch, based on the given events.
+        :param events: All events that shall be contained in the index.
+        """
+        self._polls = {}
+        for event in events:
+            self.add(event)
+
+    def add(self, event: "Event"):
+        """
+        Adds the given event to the index.
+        :param event: The event to add.
+        """
+        insort(
+            self._polls.setdefault(event.owner_id, []),
+            (event.time_created, str(event.id)),
+        )
+
+    def remove(self, event: "Event"):
+        """
+        Removes the given event from the index. Does nothing if the event is not contained in it.
+        :param event: The event to remove.
+        """
+        polls = self._polls.get(event.owner_id, [])
+        entry = (event.time_created, str(event.id))
+        position = bisect_left(polls, entry)
+        if position < len(polls) and polls[position] == entry:
+            del polls[position]
+            if not polls:
+                del self._polls[event.owner_id]
+
+    def count(self, owner_id: int) -> int:
+        """
+        Returns the number of polls the given user has created.
+        :param owner_id: The Telegram ID of the user.
+        :return: The number of polls owned by the user.
+        """
+        return len(self._polls.get(owner_id, []))
+
+    def recent(self, owner_id: int, limit: Optional[int] = None) -> list[str]:
+        """
+        Returns the IDs of the most recently created polls of the given user, newest first.
+        :param owner_id: The Telegram ID of the user.
+        :param limit: The maximum number of poll IDs to return. If None, all are returned.
+        :return: The IDs of the user's polls, sorted by creation time in descending order.
+        """
+        polls = self._polls.get(owner_id, [])
+        if limit is not None:
+            polls = polls[-limit:] if limit > 0 else []
+        return [poll_id for _, poll_id in reversed(polls)]
+
+
+class TitleSearchIndex:
+    """
+    A per-owner trigram index over poll titles, used to search the polls of a user by (parts of) their title.
+    Queries of at least three characters are answered by intersecting the sets of polls containing each of
+    the query's trigrams, so only the few polls which can actually match need to be compared with the query.
+    """
+
+    def __init__(self):
+        # Maps poll IDs to their normalized title, owner and creation time.
+        self._polls: dict[str, tuple[str, int, datetime]] = {}
+        # For each owner, maps trigrams to the IDs of the polls whose title contains the trigram.
+        self._trigrams: dict[int, dict[str, set[str]]] = {}
+        # For each owner, contains the IDs of all of their polls (needed for queries shorter than a trigram).
+        self._owner_polls: dict[int, set[str]] = {}
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return text.casefold()
+
+    @staticmethod
+    def _trigrams_of(text: str) -> set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def rebuild(self, events: Iterable["Event"]):
+        """
+        Rebuilds the index from scratch, based on the given events.
+        :param events: All events that shall be contained in the index.
+        """
+        self._polls = {}
+        self._trigrams = {}
+        self._owner_polls = {}
+        for event in events:
+            self.add(event)
+
+    def add(self, event: "Event"):
+        """
+        Adds the given event to the index.
+        :param event: The event to add.
+        """
+        poll_id = str(event.id)
+        title = self._normalize(event.title)
+        self._polls[poll_id] = (title, event.owner_id, event.time_created)
+        self._owner_polls.setdefault(event.owner_id, set()).add(poll_id)
+        trigrams = self._trigrams.setdefault(event.owner_id, {})
+        for trigram in self._trigrams_of(title):
+            trigrams.setdefault(trigram, set()).add(poll_id)
+
+    def remove(self, event: "Event"):
+        """
+        Removes the given event from the index. Does nothing if the event is not contained in it.
+        :param event: The event to remove.
+        """
+        poll_id = str(event.id)
+        if poll_id not in self._polls:
+            return
+        title, owner_id, _ = self._polls.pop(poll_id)
+        self._owner_polls[owner_id].discard(poll_id)
+        if not self._owner_polls[owner_id]:
+            del self._owner_polls[owner_id]
+        trigrams = self._trigrams.get(owner_id, {})
+        for trigram in self._trigrams_of(title):
+            trigrams[trigram].discard(poll_id)
+            if not trigrams[trigram]:
+                del trigrams[trigram]
+        if not trigrams:
+            self._trigrams.pop(owner_id, None)
+
+    def search(self, owner_id: int, query: str, limit: Optional[int] = None) -> list[str]:
+        """
+        Searches the polls of the given user for titles containing the given query (case-insensitively).
+        Results are ranked as follows: Exact matches come first, followed by titles starting with the query,
+        then titles containing a word starting with the query, and finally titles containing the query anywhere.
+        Within each group, earlier matches come first, and then newer polls come before older ones.
+        :param owner_id: The Telegram ID of the user whose polls to search.
+        :param query: The text to search for.
+        :param limit: The maximum number of poll IDs to return. If None, all matches are returned.
+        :return: The IDs of the matching polls, best matches first.
+        """
+        query = self._normalize(query)
+        if len(query) < 3:
+            candidates = self._owner_polls.get(owner_id, set())
+        else:
+            trigrams = self._trigrams.get(owner_id, {})
+            # We intersect the smallest sets first, so that the intermediate results stay small.
+            poll_sets = sorted(
+                (trigrams.get(trigram, set()) for trigram in self._trigrams_of(query)),
+                key=len,
+            )
+            candidates = set(poll_sets[0]).intersection(*poll_sets[1:])
+
+        ranked = []
+        for poll_id in candidates:
+            title, _, time_created = self._polls[poll_id]
+            # Trigrams may also match if they appear in a different order, so we need to verify each candidate.
+            position = title.find(query)
+            if position == -1:
+                continue
+            if title == query:
+                rank = 0
+            elif position == 0:
+                rank = 1
+            elif not title[position - 1].isalnum():
+                rank = 2
+            else:
+                rank = 3
+            ranked.append((rank, position, -time_created.timestamp(), poll_id))
+
+        ranked.sort()
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [poll_id for *_, poll_id in ranked]
+
+
+class PollStatistics:
+    """
+    Aggregate counts over all stored polls, which are updated incrementally as polls and votes are added,
+    so that they can be reported without scanning all polls.
+
+    Attributes:
+        polls: The number of stored polls.
+        votes: The number of votes on all stored polls.
+    """
+
+    def __init__(self):
+        self.polls = 0
+        self.votes = 0
+        # Maps the Telegram IDs of voters to the number of stored polls they have voted on.
+        self._polls_per_voter: dict[int, int] = {}
+
+    @property
+    def voters(self) -> int:
+        """
+        The number of distinct users who have voted on any of the stored polls.
+        """
+        return len(self._polls_per_voter)
+
+    def rebuild(self, events: Iterable["Event"]):
+        """
+        Recomputes the statistics from scratch, based on the given events.
+        :param events: All events that shall be counted.
+        """
+        self.polls = 0
+        self.votes = 0
+        self._polls_per_voter = {}
+        for event in events:
+            self.add(event)
+
+    def add(self, event: "Event"):
+        """
+        Counts the given event, along with its votes.
+        :param event: The event to count.
+        """
+        self.polls += 1
+        for vote in event.votes:
+            self.add_vote(vote.user_id)
+
+    def remove(self, event: "Event"):
+        """
+        Stops counting the given event, along with its votes.
+        :param event: The event to remove.
+        """
+        self.polls -= 1
+        for vote in event.votes:
+            user_id = int(vote.user_id)
+            self.votes -= 1
+            self._polls_per_voter[user_id] -= 1
+            if self._polls_per_voter[user_id] == 0:
+                del self._polls_per_voter[user_id]
+
+    def add_vote(self, user_id: int):
+        """
+        Counts a new vote on one of the counted events.
+        :param user_id: The Telegram ID of the user who cast the vote.
+        """
+        user_id = int(user_id)
+        self.votes += 1
+        self._polls_per_voter[user_id] = self._polls_per_voter.get(user_id, 0) + 1
@@ -0,0 +1,283 @@
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from typing import Awaitable, Callable, Iterable, Optional
+
+from src.shared import shared_context
+
+# The default buckets (upper bounds, in seconds) for latency histograms.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...], **extra: str) -> str:
+    pairs = list(zip(label_names, label_values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """
+    Base class for metrics, which are exposed in the Prometheus text format.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+    def samples(self) -> Iterable[str]:
+        """
+        Returns the lines containing the current samples of this metric.
+        """
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        """
+        Returns this metric in the Prometheus text format.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    A metric which can only be increased, such as the number of errors.
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        """
+        Increases the counter with the given label values.
+        :param label_values: The values of the labels, in the order of `label_names`.
+        :param amount: The amount by which to increase the counter.
+        """
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, label_values)} {value}"
+
+
+class Gauge(Metric):
+    """
+    A metric whose value is determined by calling a function whenever the metrics are exposed.
+    This way, the hot paths don't need to update the gauge at all.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], Optional[float]]):
+        """
+        :param function: Returns the current value of the gauge, or None if it is not available.
+        """
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self) -> Iterable[str]:
+        if (value := self.function()) is not None:
+            yield f"{self.name} {value}"
+
+
+class Histogram(Metric):
+    """
+    A metric sampling observations (such as latencies) into buckets.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+        # For each combination of label values, contains the (non-cumulative) bucket counts and the sum.
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        """
+        Records an observation with the given label values.
+        :param value: The observed value.
+        :param label_values: The values of the labels, in the order of `label_names`.
+        """
+        entry = self._values.get(label_values)
+        if entry is None:
+            # The last bucket is the +Inf bucket.
+            entry = self._values[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self) -> Iterable[str]:
+        for label_values, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, le=str(bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum{labels} {total[0]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """
+    Contains all metrics, so that they can be exposed together.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Registers the given metric. Metrics are identified by their name.
+        :param metric: The metric to register.
+        :return: The given metric.
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self) -> str:
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+        return "\n".join(metric.expose() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(
+    Histogram(
+        "dayfinder_http_request_duration_seconds",
+        "Time spent handling HTTP requests.",
+        ("method", "route", "status"),
+    )
+)
+telegram_handler_duration = registry.register(
+    Histogram(
+        "dayfinder_telegram_handler_duration_seconds",
+        "Time spent handling Telegram updates.",
+        ("handler",),
+    )
+)
+telegram_handler_errors = registry.register(
+    Counter(
+        "dayfinder_telegram_handler_errors_total",
+        "Number of Telegram updates whose handler raised an exception.",
+        ("handler",),
+    )
+)
+persistence_flush_duration = registry.register(
+    Histogram("dayfinder_persistence_flush_duration_seconds", "Time spent flushing changes to the storage.")
+)
+persistence_flush_changes = registry.register(
+    Histogram(
+        "dayfinder_persistence_flush_changes",
+        "Number of changes written per flush.",
+        buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+    )
+)
+send_message_duration = registry.register(
+    Histogram(
+        "dayfinder_send_message_duration_seconds",
+        "Time spent sending messages to users via the Telegram API.",
+    )
+)
+send_message_errors = registry.register(
+    Counter(
+        "dayfinder_send_message_errors_total",
+        "Number of messages that could not be sent, by type of error.",
+        ("error",),
+    )
+)
+
+event_loop_lag = registry.register(
+    Histogram(
+        "dayfinder_event_loop_lag_seconds",
+        "How long the event loop was blocked, measured as the delay with which it woke up from short sleeps.",
+    )
+)
+# How often (in seconds) the event loop lag is measured.
+EVENT_LOOP_LAG_INTERVAL = 0.1
+
+
+def _count_polls() -> int:
+    return shared_context.statistics.polls
+
+
+def _count_votes() -> int:
+    return shared_context.statistics.votes
+
+
+def _count_voters() -> int:
+    return shared_context.statistics.voters
+
+
+def _storage_size() -> Optional[int]:
+    if shared_context.storage is None:
+        return None
+    return shared_context.storage.size()
+
+
+registry.register(Gauge("dayfinder_polls", "Number of stored polls.", _count_polls))
+registry.register(Gauge("dayfinder_votes", "Number of votes on all stored polls.", _count_votes))
+registry.register(
+    Gauge("dayfinder_voters", "Number of distinct users who voted on any stored poll.", _count_voters)
+)
+registry.register(
+    Gauge("dayfinder_storage_bytes", "Size of the storage on disk, in bytes.", _storage_size)
+)
+
+
+def instrument_handler(
+    callback: Callable[..., Awaitable[None]]
+) -> Callable[..., Awaitable[None]]:
+    """
+    Wraps the given Telegram handler callback, so that its latency and errors are recorded.
+    :param callback: The callback to wrap.
+    :return: The wrapped callback.
+    """
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            telegram_handler_errors.inc(callback.__name__)
+            raise
+        finally:
+            telegram_handler_duration.observe(time.perf_counter() - start, callback.__name__)
+
+    return wrapper
+
+
+async def monitor_event_loop_lag():
+    """
+    Measures the event loop lag (see `event_loop_lag`) until cancelled.
+    Any code blocking the event loop delays the end of the sleep, so the delay is a bound on how long it blocked.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        event_loop_lag.observe(max(0.0, loop.time() - start - EVENT_LOOP_LAG_INTERVAL))
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from telegram.error import RetryAfter, TelegramError
+
+from src import metrics
+from src.shared import Event, shared_context
+
+# Telegram allows bots to send about 30 messages per second in total, and about one message per second per chat.
+# See https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_MESSAGES_PER_SECOND = 30
+SECONDS_BETWEEN_CHAT_MESSAGES = 1.0
+
+
+class RateLimiter:
+    """
+    Limits the rate at which messages are sent, both globally and per chat.
+    """
+
+    def __init__(self, global_rate: float, chat_interval: float):
+        """
+        :param global_rate: The maximum number of messages per second across all chats.
+        :param chat_interval: The minimum time (in seconds) between two messages to the same chat.
+        """
+        self.global_interval = 1 / global_rate
+        self.chat_interval = chat_interval
+        self._next_global = 0.0
+        self._next_chat: dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        """
+        Waits until a message may be sent to the given chat, and reserves the slot for it.
+        :param chat_id: The ID of the chat the message will be sent to.
+        """
+        now = time.monotonic()
+        slot = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+        # We reserve the slot before sleeping, so that concurrent workers don't pick the same one.
+        self._next_global = slot + self.global_interval
+        self._next_chat[chat_id] = slot + self.chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        # Entries for chats whose interval has passed are no longer needed.
+        if len(self._next_chat) > 1024:
+            self._next_chat = {
+                chat: next_time
+                for chat, next_time in self._next_chat.items()
+                if next_time > now
+            }
+
+
+class _VoteNotifications:
+    """
+    Keeps track of the vote notifications for a single poll within the current coalescing window.
+    """
+
+    def __init__(self, timer: asyncio.TimerHandle):
+        self.timer = timer
+        self.pending = 0
+
+
+class NotificationQueue:
+    """
+    Sends messages to Telegram users in the background, so that request handlers don't need to wait for the
+    Telegram API. Messages are sent by worker tasks, which adhere to Telegram's rate limits.
+
+    Vote notifications are coalesced per poll: The first vote within a window is notified immediately,
+    while all further votes within the window are summarized in a single message once the window ends.
+    """
+
+    def __init__(
+        self,
+        coalesce_window: float,
+        num_workers: int = 4,
+        global_rate: float = GLOBAL_MESSAGES_PER_SECOND,
+    ):
+        """
+        :param coalesce_window: The length (in seconds) of the window within which vote notifications are coalesced.
+        :param num_workers: The number of worker tasks sending messages.
+        :param global_rate: The maximum number of messages per second sent by this queue across all chats.
+        """
+        self.coalesce_window = coalesce_window
+        self.num_workers = num_workers
+        self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue()
+        self._rate_limiter = RateLimiter(global_rate, SECONDS_BETWEEN_CHAT_MESSAGES)
+        self._workers: list[asyncio.Task] = []
+        self._vote_notifications: dict[str, _VoteNotifications] = {}
+
+    def start(self):
+        """
+        Starts the worker tasks.
+        """
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.num_workers)
+        ]
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Sends all pending messages (waiting at most `timeout` seconds) and stops the worker tasks.
+        :param timeout: The maximum time (in seconds) to wait for pending messages to be sent.
+        """
+        for poll_id in list(self._vote_notifications):
+            self._vote_notifications[poll_id].timer.cancel()
+            self._end_window(poll_id, restart=False)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(
+                f"Could not send {self._queue.qsize()} pending notifications before shutdown."
+            )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def send(self, chat_id: int, text: str):
+        """
+        Queues a message to be sent to the given chat.
+        :param chat_id: The ID of the chat to send the message to.
+        :param text: The text of the message.
+        """
+        self._queue.put_nowait((chat_id, text))
+
+    def notify_vote(self, event: Event, text: str):
+        """
+        Notifies the owner of the given poll about a new or edited vote.
+        If other votes on the poll have been notified recently, the notification is coalesced with them.
+        :param event: The poll on which a vote was cast.
+        :param text: The message to send if the notification is not coalesced.
+        """
+        poll_id = str(event.id)
+        if (notifications := self._vote_notifications.get(poll_id)) is not None:
+            notifications.pending += 1
+            return
+
+        self.send(event.owner_id, text)
+        self._start_window(poll_id)
+
+    def _start_window(self, poll_id: str):
+        timer = asyncio.get_running_loop().call_later(
+            self.coalesce_window, self._end_window, poll_id
+        )
+        self._vote_notifications[poll_id] = _VoteNotifications(timer)
+
+    def _end_window(self, poll_id: str, restart: bool = True):
+        """
+        Sends a summary of the votes coalesced within the window that just ended, if there are any.
+        In that case, a new window is started, so that the next votes are coalesced as well.
+        """
+        notifications = self._vote_notifications.pop(poll_id)
+        if notifications.pending == 0:
+            return
+
+        event: Optional[Event] = shared_context.telegram_app.bot_data["events"].get(
+            poll_id
+        )
+        if event is None:
+            # The poll has been deleted in the meantime.
+            return
+        if notifications.pending == 1:
+            summary = "1 more vote was"
+        else:
+            summary = f"{notifications.pending} more votes were"
+        self.send(
+            event.owner_id,
+            f'{summary} cast or edited on your poll "{event.title}"!\n\n'
+            "You can view the results of your polls at any time using /polls.",
+        )
+        if restart:
+            self._start_window(poll_id)
+
+    async def _work(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            try:
+                await self._rate_limiter.wait(chat_id)
+                await self._send_message(chat_id, text)
+            except Exception as e:
+                # If the worker died here, notifications would silently stop once all workers are gone.
+                metrics.send_message_errors.inc(type(e).__name__)
+                logging.exception(f"Could not send notification to user {chat_id}.")
+            finally:
+                self._queue.task_done()
+
+    async def _send_message(self, chat_id: int, text: str, retry: bool = True):
+        start = time.perf_counter()
+        try:
+            await shared_context.telegram_app.bot.send_message(chat_id=chat_id, text=text)
+            return
+        except TelegramError as e:
+            error = e
+        finally:
+            metrics.send_message_duration.observe(time.perf_counter() - start)
+
+        metrics.send_message_errors.inc(type(error).__name__)
+        if isinstance(error, RetryAfter):
+            if retry:
+                # We have hit a flood limit nonetheless, so we wait as requested and try once more.
+                await asyncio.sleep(error.retry_after)
+                await self._send_message(chat_id, text, retry=False)
+            else:
+                logging.warning(f"Could not send notification to user {chat_id}: {error.message}")
+        else:
+            # User probably blocked bot, this is fine. We should create a warning, though.
+            logging.warning(f"User {chat_id} blocked bot, could not send notification.")
@@ -0,0 +1,56 @@
+import time
+from typing import Hashable
+
+# Buckets are only pruned once there are at least this many of them.
+MIN_PRUNE_SIZE = 1024
+
+
+class TokenBucketLimiter:
+    """
+    Limits the rate of requests separately for each key (such as a user ID), using the token bucket algorithm:
+    Each key has a bucket holding up to `burst` tokens, which is refilled at `rate` tokens per second.
+    Every request takes a token from the bucket of its key, and is rejected if the bucket is empty.
+    This way, short bursts of requests are allowed, while the long-term rate is bounded by `rate`.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: The number of tokens added to each bucket per second.
+        :param burst: The maximum number of tokens in each bucket.
+        """
+        self.rate = rate
+        self.burst = burst
+        # Maps keys to the number of tokens in their bucket and the time at which that number was computed.
+        # Keys whose bucket would be full by now don't need an entry, so these are pruned from time to time.
+        self._buckets: dict[Hashable, tuple[float, float]] = {}
+        self._prune_at = MIN_PRUNE_SIZE
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def acquire(self, key: Hashable) -> float:
+        """
+        Takes a token from the bucket of the given key, if there is one.
+        :param key: The key whose bucket to use.
+        :return: 0 if a token has been taken, i.e., the request is allowed.
+                 Otherwise, the time (in seconds) until the next token will be available.
+        """
+        now = time.monotonic()
+        tokens = self._tokens(key, now)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) >= self._prune_at:
+            self._prune(now)
+        return 0
+
+    def _prune(self, now: float):
+        """
+        Removes the buckets which have been refilled completely.
+        """
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if self._tokens(key, now) < self.burst
+        }
+        # This way, pruning takes amortized constant time per request.
+        self._prune_at = max(MIN_PRUNE_SIZE, 2 * len(self._buckets))
@@ -0,0 +1,214 @@
+import heapq
+import re
+from dataclasses import dataclass
+from datetime import date
+from itertools import accumulate
+from operator import itemgetter
+from typing import Iterable
+
+from src.cache import VersionedCache
+from src.shared import Event, VOTE_CODES, VoteType, run_cpu_bound, shared_context
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional. Without it, the same results are computed in pure Python, which is slower for large polls.
+    numpy = None
+
+# The number of best windows kept per window length.
+MAX_WINDOWS = 3
+
+# Translates vote codes to 1 if the voter is available on that day (i.e., voted yes or maybe), and 0 otherwise.
+_AVAILABILITY = bytes(int(code != VOTE_CODES[VoteType.no]) for code in range(256))
+_AVAILABLE_RUN = re.compile(rb"\x01+")
+
+# Maps poll IDs to the scores of the poll.
+scores_cache = VersionedCache(max_size=1024)
+
+
+@dataclass(frozen=True)
+class ScoringWeights:
+    """
+    The weights with which votes of each type count towards the score of a day.
+    """
+
+    yes: float = 1.0
+    maybe: float = 0.5
+    no: float = 0.0
+
+
+@dataclass(frozen=True)
+class DayWindow:
+    """
+    A window of consecutive days of a poll, such as a weekend.
+
+    Attributes:
+        days: The days of the window, in chronological order.
+        score: The sum of the scores of the days of the window.
+        available: The number of voters who voted yes or maybe on every day of the window.
+    """
+
+    days: tuple[str, ...]
+    score: float
+    available: int
+
+
+@dataclass
+class PollScores:
+    """
+    The scores of all days of a poll, along with their ranking and the best windows of consecutive days.
+
+    Attributes:
+        scores: A dictionary mapping each day to its score, i.e., the weighted sum of the votes on that day.
+        ranking: All days of the poll, ordered from best to worst. Days with equal scores are ordered by their
+                 number of yes votes, then by their number of maybe votes, and finally by their order in the poll.
+        ranks: A dictionary mapping each day to its rank (starting at 1). Days which are equal with regard to
+               score, yes votes and maybe votes share the same rank.
+        windows: A dictionary mapping each window length to the best windows of that many consecutive days,
+                 ordered from best to worst by their score and then by their number of available voters.
+                 Only windows in which every day is part of the poll are considered.
+    """
+
+    scores: dict[str, float]
+    ranking: list[str]
+    ranks: dict[str, int]
+    windows: dict[int, list[DayWindow]]
+
+
+def compute_scores(
+    event: Event,
+    weights: ScoringWeights,
+    window_lengths: Iterable[int],
+    max_windows: int = MAX_WINDOWS,
+) -> PollScores:
+    """
+    Scores the days of the given poll and finds its best windows of consecutive days.
+    :param event: The poll to score.
+    :param weights: The weights of the vote types.
+    :param window_lengths: The lengths of the windows of consecutive days to find.
+    :param max_windows: The maximum number of windows to return per window length.
+    :return: The scores of the poll.
+    """
+    # The tally already contains the number of votes per day and type, so we don't need to go over the votes here.
+    tallies = {
+        day: (
+            event.num_votes(day, VoteType.yes),
+            event.num_votes(day, VoteType.maybe),
+            event.num_votes(day, VoteType.no),
+        )
+        for day in event.days
+    }
+    scores = {
+        day: weights.yes * yes + weights.maybe * maybe + weights.no * no
+        for day, (yes, maybe, no) in tallies.items()
+    }
+
+    def rank_key(day: str) -> tuple[float, int, int]:
+        return scores[day], tallies[day][0], tallies[day][1]
+
+    # Sorting is stable, so days with equal keys stay in the order of the poll.
+    ranking = sorted(event.days, key=rank_key, reverse=True)
+    ranks: dict[str, int] = {}
+    for position, day in enumerate(ranking):
+        if position > 0 and rank_key(day) == rank_key(ranking[position - 1]):
+            ranks[day] = ranks[ranking[position - 1]]
+        else:
+            ranks[day] = position + 1
+
+    # Days are in ISO format, so sorting them as strings sorts them chronologically.
+    chronological = sorted(event.days)
+    ordinals = [date.fromisoformat(day).toordinal() for day in chronological]
+    lengths = sorted({length for length in window_lengths if 1 <= length <= len(chronological)})
+    available = _count_available(event, chronological, lengths)
+    # With these prefix sums, the score of each window is the difference of two of them (i.e., a sliding-window sum).
+    prefix_scores = list(accumulate((scores[day] for day in chronological), initial=0.0))
+    windows = {}
+    for length in lengths:
+        candidates = (
+            DayWindow(
+                days=tuple(chronological[start : start + length]),
+                score=round(prefix_scores[start + length] - prefix_scores[start], 9),
+                available=available[length][start],
+            )
+            for start in range(len(chronological) - length + 1)
+            # Windows spanning a day which is not part of the poll are skipped.
+            if ordinals[start + length - 1] - ordinals[start] == length - 1
+        )
+        # nlargest is stable as well, so earlier windows win ties.
+        windows[length] = heapq.nlargest(
+            max_windows, candidates, key=lambda window: (window.score, window.available)
+        )
+    return PollScores(scores=scores, ranking=ranking, ranks=ranks, windows=windows)
+
+
+def _count_available(
+    event: Event, chronological: list[str], lengths: list[int]
+) -> dict[int, list[int]]:
+    """
+    Counts, for each window length and each possible start of a window, the voters who voted yes or maybe
+    on every day of the window, based on a matrix of votes × days.
+    :param event: The poll whose votes to count.
+    :param chronological: The days of the poll in chronological order.
+    :param lengths: The window lengths, none of which may be larger than the number of days.
+    :return: A dictionary mapping each window length to the counts, indexed by the position (in `chronological`)
+    of the first day of the window. Windows spanning days which are not consecutive are counted as well.
+    """
+    num_days = len(chronological)
+    positions = {day: position for position, day in enumerate(event.days)}
+    order = [positions[day] for day in chronological]
+    reorder = order != list(range(num_days))
+    if not event.votes or not lengths:
+        return {length: [0] * (num_days - length + 1) for length in lengths}
+
+    if numpy is not None:
+        # Votes may be added while this runs in a worker thread, so the number of rows is taken from the matrix itself.
+        matrix = numpy.frombuffer(event.vote_matrix(), dtype=numpy.uint8).reshape(-1, len(event.days))
+        if reorder:
+            matrix = matrix[:, order]
+        # Each row holds the running number of days on which the voter is available, so that the number of
+        # available days within each window can be computed for all windows at once.
+        cumulative = numpy.zeros((len(matrix), num_days + 1), dtype=numpy.int32)
+        numpy.cumsum(matrix != VOTE_CODES[VoteType.no], axis=1, out=cumulative[:, 1:])
+        return {
+            length: ((cumulative[:, length:] - cumulative[:, :-length]) == length).sum(axis=0).tolist()
+            for length in lengths
+        }
+
+    # Without NumPy, we find each voter's runs of available days (which is fast, as it is done by the regex engine),
+    # and mark the windows fitting into each run in a difference array.
+    pick = itemgetter(*order)
+    differences = {length: [0] * (num_days + 1) for length in lengths}
+    for vote in event.votes:
+        codes = bytes(pick(vote.vote.codes)) if reorder else vote.vote.codes
+        for run in _AVAILABLE_RUN.finditer(codes.translate(_AVAILABILITY)):
+            start, end = run.span()
+            for length in lengths:
+                if end - start >= length:
+                    differences[length][start] += 1
+                    differences[length][end - length + 1] -= 1
+    return {
+        length: list(accumulate(difference[: num_days - length + 1]))
+        for length, difference in differences.items()
+    }
+
+
+async def get_scores(event: Event) -> PollScores:
+    """
+    Returns the scores of the given poll, using the weights and window lengths given in the arguments
+    (see --score-weights and --window-lengths). The scores are cached until the poll changes.
+    For polls with many votes, they are computed in a worker thread (see --offload-threshold).
+    :param event: The poll whose scores to return.
+    :return: The scores of the poll.
+    """
+    poll_id = str(event.id)
+    # The poll may change while the scores are computed, in which case they are cached for the version we started with
+    # (and thus never returned again).
+    version = event.version
+    if (cached := scores_cache.get(poll_id, version)) is not None:
+        return cached
+    args = shared_context.args
+    scores = await run_cpu_bound(
+        len(event.votes), compute_scores, event, ScoringWeights(*args.score_weights), args.window_lengths
+    )
+    scores_cache.put(poll_id, version, scores)
+    return scores
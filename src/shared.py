@@ -1,12 +1,26 @@
+import asyncio
 import enum
+import itertools
+import sys
 import uuid
 from argparse import Namespace
-from dataclasses import dataclass, field
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass, field, fields
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Optional, TypeVar, TYPE_CHECKING
 
 from telegram.ext import Application
 
+from src.indexes import OwnerIndex, PollStatistics, TitleSearchIndex
+
+if TYPE_CHECKING:
+    from src.auth import WebAppAuthenticator
+    from src.notifications import NotificationQueue
+    from src.ratelimit import TokenBucketLimiter
+    from src.storage import Storage, PersistenceScheduler
+
+T = TypeVar("T")
+
 
 class VoteType(enum.StrEnum):
     """
@@ -18,6 +32,94 @@ class VoteType(enum.StrEnum):
     maybe = "maybe"
 
 
+# The vote types, indexed by the single-byte code with which they are stored in a CompactVote.
+VOTE_TYPES: tuple[VoteType, ...] = tuple(VoteType)
+# Maps vote types (or their string values) to their single-byte code.
+VOTE_CODES: dict[str, int] = {vote_type: code for code, vote_type in enumerate(VOTE_TYPES)}
+
+
+class CompactVote(Mapping[str, VoteType]):
+    """
+    The choices of a single vote, stored as one byte per day instead of as a dictionary.
+    Behaves like a read-only dictionary mapping days to the type of vote cast on that day.
+
+    Attributes:
+        positions: A dictionary mapping each day to its position in `codes`.
+                   This is shared by all votes of the same event, so it only needs to be stored once.
+        codes: The codes (see VOTE_CODES) of the vote types, one byte per day.
+    """
+
+    __slots__ = ("positions", "codes")
+
+    def __init__(self, positions: dict[str, int], codes: bytes):
+        self.positions = positions
+        self.codes = codes
+
+    @classmethod
+    def from_mapping(
+        cls,
+        vote: Mapping[str, VoteType | str],
+        positions: Optional[dict[str, int]] = None,
+    ) -> "CompactVote":
+        """
+        Creates a compact vote from the given dictionary.
+        :param vote: A dictionary mapping days to the type of vote cast on that day.
+        :param positions: The positions of the days to use. If not given, the order of the dictionary is used.
+        :return: The compact vote.
+        :raises ValueError: If the dictionary does not contain exactly the days given by `positions`.
+        """
+        if isinstance(vote, CompactVote) and vote.positions is positions:
+            return vote
+        if positions is None:
+            positions = {day: position for position, day in enumerate(vote)}
+        elif vote.keys() != positions.keys():
+            # Every code is a valid vote type, so a missing day would silently be stored as a vote.
+            raise ValueError("The vote must contain exactly one choice for each day of the event.")
+        codes = bytearray(len(positions))
+        for day, vote_type in vote.items():
+            codes[positions[day]] = VOTE_CODES[vote_type]
+        return cls(positions, bytes(codes))
+
+    def __getitem__(self, day: str) -> VoteType:
+        return VOTE_TYPES[self.codes[self.positions[day]]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __reduce__(self):
+        return CompactVote, (self.positions, self.codes)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+# The versions of all events are drawn from this process-wide counter (see Event.version).
+_versions = itertools.count(1)
+
+
+def next_version() -> int:
+    """
+    :return: A version number that is larger than all versions returned before within this process.
+    """
+    return next(_versions)
+
+
+class ProcessRole(enum.StrEnum):
+    """
+    Enum for the roles a process can have. Only in multi-process mode (see --web-workers) are the roles split up.
+    """
+
+    # Handles both Telegram updates and web requests.
+    all = "all"
+    # Only handles Telegram updates.
+    bot = "bot"
+    # Only handles web requests.
+    web = "web"
+
+
 @dataclass
 class SharedContext:
     """
@@ -26,13 +128,113 @@ class SharedContext:
     Attributes:
         telegram_app: The Telegram bot's Application object.
         args: The command line arguments.
+        storage: The storage backend in which polls are persisted.
+        persistence: The scheduler through which changes to polls are recorded to the storage backend.
+        authenticator: Authenticates the data sent by the Telegram webapp.
+        notifications: The queue through which messages to users are sent in the background.
+        rate_limiter: Limits the rate of requests each user may make to the API, if enabled (see --rate-limit).
+        owner_index: An index from the Telegram IDs of users to the polls they own.
+        search_index: An index used to search the polls of a user by their title.
+        statistics: Aggregate counts over all stored polls, such as the number of votes.
+        role: The role of this process.
     """
 
     telegram_app: Application = None
     args: Optional[Namespace] = None
+    storage: Optional["Storage"] = None
+    persistence: Optional["PersistenceScheduler"] = None
+    authenticator: Optional["WebAppAuthenticator"] = None
+    notifications: Optional["NotificationQueue"] = None
+    rate_limiter: Optional["TokenBucketLimiter"] = None
+    owner_index: OwnerIndex = field(default_factory=OwnerIndex)
+    search_index: TitleSearchIndex = field(default_factory=TitleSearchIndex)
+    statistics: PollStatistics = field(default_factory=PollStatistics)
+    role: ProcessRole = ProcessRole.all
 
+    @property
+    def events(self) -> dict[str, "Event"]:
+        """
+        The dictionary mapping poll IDs to all stored polls.
+        """
+        return self.telegram_app.bot_data["events"]
 
-@dataclass
+    def rebuild_indexes(self):
+        """
+        Rebuilds all indexes over the stored polls. Should be called once the stored polls have been loaded.
+        """
+        self.owner_index.rebuild(self.events.values())
+        self.search_index.rebuild(self.events.values())
+        self.statistics.rebuild(self.events.values())
+
+    def add_event(self, event: "Event"):
+        """
+        Stores the given poll and adds it to all indexes.
+        :param event: The poll to store.
+        """
+        self.events[str(event.id)] = event
+        self.owner_index.add(event)
+        self.search_index.add(event)
+        self.statistics.add(event)
+
+    def remove_event(self, poll_id: str) -> "Event":
+        """
+        Removes the poll with the given ID from the stored polls and from all indexes.
+        :param poll_id: The ID of the poll to remove.
+        :return: The removed poll.
+        """
+        event = self.events.pop(poll_id)
+        # Anything derived from the poll must not be used anymore.
+        event.version = next_version()
+        self.owner_index.remove(event)
+        self.search_index.remove(event)
+        self.statistics.remove(event)
+        return event
+
+    def add_vote(self, event: "Event", vote: "EventVote"):
+        """
+        Adds a new vote to the given stored poll (see `Event.add_vote`) and updates the statistics.
+        :param event: The poll on which the vote has been cast.
+        :param vote: The vote to add.
+        """
+        event.add_vote(vote)
+        self.statistics.add_vote(vote.user_id)
+
+    def replace_event(self, event: "Event"):
+        """
+        Stores the given poll in place of the stored poll with the same ID, if there is one.
+        This is used when a poll has been changed by another process.
+        :param event: The poll to store.
+        """
+        poll_id = str(event.id)
+        if poll_id in self.events:
+            old_event = self.remove_event(poll_id)
+            event.last_active = max(event.last_active, old_event.last_active)
+        self.add_event(event)
+
+    async def get_event(self, poll_id: str) -> Optional["Event"]:
+        """
+        Returns the poll with the given ID and records that it has been active.
+        If the poll has been archived (see --archive-after-days), it is restored from the archive first.
+        :param poll_id: The ID of the poll to return.
+        :return: The poll, or None if there is no poll with the given ID.
+        """
+        event = self.events.get(poll_id)
+        if event is not None:
+            event.touch()
+            self.storage.record_activity(event)
+            return event
+
+        event = self.storage.load_archived(poll_id)
+        if event is None:
+            return None
+        # We add the poll before waiting for the storage, so that concurrent requests don't restore it again.
+        event.touch()
+        self.add_event(event)
+        await self.persistence.restore_event(event)
+        return event
+
+
+@dataclass(slots=True)
 class Event:
     """
     Represents an event that users can vote on.
@@ -44,9 +246,18 @@ class Event:
         notify: Whether to notify users when the event is created.
         anonymous: Whether to hide the names of users who voted.
         votes: A list of the votes cast on the event.
+               Votes must be added and edited via `add_vote` and `update_vote`.
         description: A description of the event.
         id: The UUID of the event.
         time_created: The time at which the event was created.
+        version: A number which is increased whenever the event changes.
+                 Can be used to detect whether values derived from the event are outdated.
+                 Versions are drawn from a process-wide counter (see `next_version`), so that a poll which is loaded
+                 again (e.g., restored from the archive or reloaded from another process) never reuses a version
+                 for which values derived from an earlier copy may still be cached.
+        last_active: The time at which the event was last created, voted on, or viewed.
+                     On load, it is estimated from the time the event and its votes were created,
+                     unless a later view has been recorded by the storage (see Storage.record_activity).
     """
 
     title: str
@@ -58,6 +269,109 @@ class Event:
     description: str = ""
     id: uuid.UUID = field(default_factory=uuid.uuid4)
     time_created: datetime = field(default_factory=datetime.now)
+    version: int = field(default_factory=next_version)
+
+    # The following fields are not persisted, but rebuilt from the votes whenever an event is loaded.
+    _tally: dict[str, dict[VoteType, int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _best_days: Optional[set[str]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _votes_by_user: dict[int, "EventVote"] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    # Maps each day to its position in the compact representation of the votes (see CompactVote).
+    _day_positions: dict[str, int] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    last_active: datetime = field(
+        default_factory=datetime.now, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self.rebuild_indexes()
+        self._estimate_last_active()
+
+    def __getstate__(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.init}
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # The persisted version may have been used by an earlier copy of this event, so a new one is drawn.
+        self.version = next_version()
+        self.rebuild_indexes()
+        self._estimate_last_active()
+
+    def _estimate_last_active(self):
+        # Views are not persisted, so the latest vote is the best estimate we have after loading an event.
+        self.last_active = max([self.time_created, *(vote.time_created for vote in self.votes)])
+
+    def rebuild_indexes(self):
+        """
+        Recomputes the vote tally and the mapping from users to votes from scratch,
+        based on the votes cast on this event.
+        This is done automatically when an event is created or loaded,
+        so it only needs to be called manually if `votes` has been modified directly.
+        """
+        self._day_positions = {day: position for position, day in enumerate(self.days)}
+        for vote in self.votes:
+            # All votes should share the day positions of this event.
+            vote.vote = CompactVote.from_mapping(vote.vote, self._day_positions)
+        self._votes_by_user = {int(vote.user_id): vote for vote in self.votes}
+        self._tally = {day: {vote_type: 0 for vote_type in VoteType} for day in self.days}
+        for vote in self.votes:
+            self._count_vote(vote.vote, 1)
+        self._best_days = None
+
+    def touch(self):
+        """
+        Records that the event has just been active, e.g., because someone viewed it.
+        """
+        self.last_active = datetime.now()
+
+    def _count_vote(self, vote: CompactVote, delta: int):
+        """
+        Adds the given delta to the tally of each day of the given vote.
+        :param vote: The vote's choices, using the day positions of this event.
+        :param delta: The amount by which to change the tally (1 to add the vote, -1 to remove it).
+        """
+        for day, code in zip(self.days, vote.codes):
+            self._tally[day][VOTE_TYPES[code]] += delta
+        self._best_days = None
+
+    def add_vote(self, vote: "EventVote"):
+        """
+        Adds a new vote to this event and updates the vote tally accordingly.
+        :param vote: The vote to add.
+        """
+        vote.vote = CompactVote.from_mapping(vote.vote, self._day_positions)
+        self.votes.append(vote)
+        self._votes_by_user[int(vote.user_id)] = vote
+        self._count_vote(vote.vote, 1)
+        self.version = next_version()
+        self.touch()
+
+    def update_vote(self, vote: "EventVote", new_vote: Mapping[str, VoteType]):
+        """
+        Replaces the choices of an existing vote on this event and updates the vote tally accordingly.
+        :param vote: The existing vote to update.
+        :param new_vote: A dictionary mapping days to the newly chosen type of vote on that day.
+        """
+        self._count_vote(vote.vote, -1)
+        vote.vote = CompactVote.from_mapping(new_vote, self._day_positions)
+        self._count_vote(vote.vote, 1)
+        self.version = next_version()
+        self.touch()
+
+    def get_vote(self, user_id: int) -> Optional["EventVote"]:
+        """
+        Returns the vote the given user has cast on this event, if any.
+        :param user_id: The Telegram ID of the user whose vote to return.
+        :return: The vote of the given user, or None if the user has not voted yet.
+        """
+        return self._votes_by_user.get(int(user_id))
 
     def num_votes(self, day: str, *vote_types: VoteType | str) -> int:
         """
@@ -66,7 +380,12 @@ class Event:
         :param vote_types: The types of votes to count. If none are given, all votes are counted.
         :return: The number of votes of the given types on the given day.
         """
-        return len(self.day_votes(day, *vote_types))
+        if day not in self._tally:
+            return 0
+        if len(vote_types) == 0:
+            return sum(self._tally[day].values())
+        # VoteType is a StrEnum, so strings can be used as keys as well.
+        return sum(self._tally[day].get(vote_type, 0) for vote_type in set(vote_types))
 
     def day_votes(self, day: str, *vote_types: VoteType | str) -> list["EventVote"]:
         """
@@ -75,12 +394,21 @@ class Event:
         :param vote_types: The types of votes to return. If none are given, all votes are returned.
         :return: The votes of the given types on the given day.
         """
-        # We do this so that we can pass in strings as well as VoteType enums.
+        # VOTE_CODES contains strings as well as VoteType enums, so we can pass in both.
         if len(vote_types) == 0:
-            typeset = set(map(str, VoteType))
+            codes = set(VOTE_CODES.values())
         else:
-            typeset = set(map(str, vote_types))
-        return [v for v in self.votes if str(v.vote[day]) in typeset]
+            codes = {VOTE_CODES[vote_type] for vote_type in vote_types}
+        position = self._day_positions[day]
+        return [v for v in self.votes if v.vote.codes[position] in codes]
+
+    def vote_matrix(self) -> bytes:
+        """
+        Returns the choices of all votes as a matrix with one row per vote (in the order of `votes`)
+        and one column per day (in the order of `days`), flattened row by row.
+        :return: The codes (see VOTE_CODES) of the vote types, one byte per vote and day.
+        """
+        return b"".join(vote.vote.codes for vote in self.votes)
 
     def max_votes(self, *vote_types: VoteType | str) -> int:
         """
@@ -96,6 +424,16 @@ class Event:
         Most suitable, in this case, means the days with the largest number of yes votes.
         If there are multiple such days, we choose from these the ones with the largest number of maybe votes.
         If there are no days with at least one yes vote, we return an empty list.
+        The result is cached until the next vote is added or updated.
+        :return: A list of the most suitable days for the event.
+        """
+        if self._best_days is None:
+            self._best_days = self._compute_best_days()
+        return set(self._best_days)
+
+    def _compute_best_days(self) -> set[str]:
+        """
+        Computes the most suitable days for the event. See `best_days` for details.
         :return: A list of the most suitable days for the event.
         """
         max_yes = self.max_votes(VoteType.yes)
@@ -103,21 +441,21 @@ class Event:
             return set()
 
         best_days = set(
-            day for day in self.days if self.num_votes(day, VoteType.yes) == max_yes
+            day for day in self.days if self._tally[day][VoteType.yes] == max_yes
         )
         if len(best_days) == 1:
             # Just one best day, so we return immediately.
             return best_days
 
         # We need to get max_maybe from best_days, so we can't just use self.max_votes.
-        max_maybe = max(self.num_votes(day, VoteType.maybe) for day in best_days)
+        max_maybe = max(self._tally[day][VoteType.maybe] for day in best_days)
         best_days = set(
-            day for day in best_days if self.num_votes(day, VoteType.maybe) == max_maybe
+            day for day in best_days if self._tally[day][VoteType.maybe] == max_maybe
         )
         return best_days
 
 
-@dataclass
+@dataclass(slots=True)
 class EventVote:
     """
     Represents a vote on an event.
@@ -128,13 +466,51 @@ class EventVote:
         user_name: The name (first name and last name, space-separated) of the user who cast the vote.
                    Can be empty if this is an anonymous vote.
         vote: A dictionary mapping days to the type of vote cast on that day.
+              Stored as a CompactVote, to which dictionaries are converted automatically.
         time_created: The time at which the vote was cast.
     """
 
     user_id: int
     user_name: str
-    vote: dict[str, VoteType] = field(default_factory=dict)
+    vote: Mapping[str, VoteType] = field(default_factory=dict)
     time_created: datetime = field(default_factory=datetime.now)
 
+    def __post_init__(self):
+        self._compact()
+
+    def __getstate__(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    def __setstate__(self, state: dict):
+        # Votes pickled by older versions store a plain dictionary, which is converted here.
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._compact()
+
+    def _compact(self):
+        """
+        Converts the vote to its compact representation, if necessary.
+        """
+        # Many votes are cast by the same users, so we only want to keep one copy of each name in memory.
+        self.user_name = sys.intern(self.user_name)
+        if not isinstance(self.vote, CompactVote):
+            self.vote = CompactVote.from_mapping(self.vote)
+
 
 shared_context: SharedContext = SharedContext()
+
+
+async def run_cpu_bound(size: int, function: Callable[..., T], *args: Any) -> T:
+    """
+    Runs the given CPU-bound function in a worker thread if its input is large (see --offload-threshold),
+    so that the event loop can handle other requests in the meantime. Otherwise, it is run directly.
+    Note that the function must tolerate the polls it reads being changed by the event loop while it runs.
+
+    :param size: The size of the function's input, e.g., the number of votes it has to go through.
+    :param function: The function to run.
+    :param args: The arguments to pass to the function.
+    :return: The return value of the function.
+    """
+    if size >= shared_context.args.offload_threshold:
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
@@ -0,0 +1,861 @@
+import asyncio
+import copy
+import copyreg
+import gzip
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from telegram.ext import Application, PicklePersistence
+
+from src import metrics
+from src.shared import Event, EventVote, VoteType, shared_context
+
+
+class Storage:
+    """
+    Base class for the backends in which polls are persisted.
+    The web server notifies the storage about every change it makes to the stored polls,
+    so that backends can write only the data that actually changed.
+    Changes only need to be durable once `flush` has been called, which is done by the PersistenceScheduler.
+    """
+
+    async def load(self, app: Application):
+        """
+        Loads all stored polls into the bot data of the given Application.
+        Called once, after the Application has been initialized.
+        :param app: The initialized Application.
+        """
+        if "events" not in app.bot_data:
+            app.bot_data["events"] = {}
+
+    def save_event(self, event: Event):
+        """
+        Records a newly created poll.
+        :param event: The poll that has been created.
+        """
+        pass
+
+    def save_vote(self, event: Event, vote: EventVote):
+        """
+        Records a vote that has been cast or edited.
+        :param event: The poll the vote belongs to.
+        :param vote: The vote that has been cast or edited.
+        """
+        pass
+
+    def delete_event(self, poll_id: str):
+        """
+        Records that a poll (along with all of its votes) has been deleted.
+        :param poll_id: The ID of the poll that has been deleted.
+        """
+        pass
+
+    def archive_event(self, event: Event):
+        """
+        Moves a poll to the archive, from which it is only loaded again once it is needed (see load_archived).
+        The poll has already been removed from the bot data.
+        :param event: The poll to archive.
+        """
+        raise NotImplementedError
+
+    def load_archived(self, poll_id: str) -> Optional[Event]:
+        """
+        Loads an archived poll. Unless `restore_event` is called afterward, the poll stays in the archive.
+        :param poll_id: The ID of the poll to load.
+        :return: The archived poll, or None if there is no archived poll with the given ID.
+        """
+        return None
+
+    def restore_event(self, event: Event):
+        """
+        Records that a poll loaded via `load_archived` has been added to the bot data again.
+        :param event: The restored poll.
+        """
+        pass
+
+    def archived_count(self) -> int:
+        """
+        Returns the number of archived polls.
+        """
+        return 0
+
+    def record_activity(self, event: Event):
+        """
+        Records that a poll has just been viewed (see Event.touch), so that processes sharing the storage
+        (see --web-workers) don't archive it. Votes are recorded via `save_vote` already.
+        :param event: The poll that has been viewed.
+        """
+        pass
+
+    def recorded_activity(self, poll_ids: list[str]) -> dict[str, datetime]:
+        """
+        Returns the times at which the given polls were last recorded as active by any process (see record_activity).
+        :param poll_ids: The IDs of the polls.
+        :return: A dictionary mapping the IDs of those polls whose activity has been recorded to the time of it.
+        """
+        return {}
+
+    async def flush(self):
+        """
+        Makes all changes recorded so far durable.
+        """
+        raise NotImplementedError
+
+    def sync(self):
+        """
+        Applies the changes that other processes have made to the stored polls since the last call.
+        Only needed if the storage is shared with other processes (see --web-workers).
+        """
+        pass
+
+    def size(self) -> Optional[int]:
+        """
+        Returns the size of the storage on disk in bytes, or None if it is not known.
+        """
+        return None
+
+    async def close(self):
+        """
+        Closes the storage. Called when the bot shuts down.
+        """
+        pass
+
+
+class _EventState:
+    """
+    The persisted attributes of an Event, which are pickled exactly like the Event, so that they are unpickled as one.
+    """
+
+    __slots__ = ("state",)
+
+    def __init__(self, state: dict):
+        self.state = state
+
+    def __reduce__(self):
+        # This creates an Event without calling __init__, and then passes the state to its __setstate__.
+        return copyreg._reconstructor, (Event, object, None), self.state
+
+
+class EventSnapshot:
+    """
+    A copy of the persisted attributes of an Event, which can be pickled in a worker thread
+    while the Event itself keeps changing on the event loop.
+    Each snapshot is pickled separately (and only once), so it can be reused for as long as the Event doesn't change.
+    It is unpickled as an Event.
+
+    Attributes:
+        version: The version of the Event at the time the snapshot was taken.
+    """
+
+    __slots__ = ("version", "_state", "_pickled")
+
+    def __init__(self, event: Event):
+        self.version = event.version
+        self._state: Optional[dict] = event.__getstate__()
+        # Votes are edited in place, so they need to be copied as well. All other attributes are never modified.
+        self._state["votes"] = [copy.copy(vote) for vote in event.votes]
+        self._pickled: Optional[bytes] = None
+
+    def pickled(self) -> bytes:
+        """
+        Returns the pickled Event, pickling it on the first call.
+        """
+        if self._pickled is None:
+            self._pickled = pickle.dumps(_EventState(self._state), protocol=pickle.HIGHEST_PROTOCOL)
+            self._state = None
+        return self._pickled
+
+    def __reduce__(self):
+        return pickle.loads, (self.pickled(),)
+
+
+class PickleStorage(Storage):
+    """
+    Stores all polls in a single pickle file, in the format used by python-telegram-bot's PicklePersistence.
+    Note that every flush rewrites the whole pickle file, including all polls.
+
+    To keep the event loop responsive, the file is pickled and written in a worker thread.
+    The thread works on snapshots of the polls taken on the event loop (see EventSnapshot),
+    which are reused as long as a poll's version doesn't change, so that only changed polls need to be copied
+    and pickled again. Unchanged polls are written from their pickled form, which is kept in memory.
+
+    Archived polls are not part of the pickle file, but stored as one compressed pickle file per poll
+    in the archive directory, so that they don't need to be rewritten on every change.
+    """
+
+    ARCHIVE_SUFFIX = ".pickle.gz"
+
+    def __init__(self, filepath: str, archive_directory: str):
+        """
+        :param filepath: The path to the pickle file. It will be created if it does not exist.
+        :param archive_directory: The directory in which archived polls are stored.
+                                  It will be created once the first poll is archived.
+        """
+        self.filepath = filepath
+        self.archive_directory = archive_directory
+        # The IDs of polls whose archive file is no longer needed once the pickle file has been written.
+        self._obsolete_archives: set[str] = set()
+        # The snapshots written by the last flush, keyed by poll ID.
+        self._snapshots: dict[str, EventSnapshot] = {}
+
+    async def load(self, app: Application):
+        bot_data = await PicklePersistence(self.filepath).get_bot_data()
+        app.bot_data["events"] = bot_data.get("events", {})
+        # If we stopped after archiving a poll, but before flushing, the poll is stored in both files.
+        # The pickle file is authoritative in that case, as the archive is only written once the poll is inactive.
+        for poll_id in self._archived_ids():
+            if poll_id in app.bot_data["events"]:
+                os.remove(self._archive_path(poll_id))
+
+    def _archive_path(self, poll_id: str) -> Optional[str]:
+        """
+        Returns the path of the archive file for the given poll, or None if the given ID is not a valid poll ID.
+        """
+        try:
+            valid = str(uuid.UUID(poll_id)) == poll_id
+        except ValueError:
+            valid = False
+        # Poll IDs are supplied by users, so we must make sure they cannot point outside the archive directory.
+        if not valid:
+            return None
+        return os.path.join(self.archive_directory, poll_id + self.ARCHIVE_SUFFIX)
+
+    def _archived_ids(self) -> list[str]:
+        if not os.path.isdir(self.archive_directory):
+            return []
+        return [
+            name.removesuffix(self.ARCHIVE_SUFFIX)
+            for name in os.listdir(self.archive_directory)
+            if name.endswith(self.ARCHIVE_SUFFIX)
+        ]
+
+    def delete_event(self, poll_id: str):
+        self._obsolete_archives.add(poll_id)
+
+    def archive_event(self, event: Event):
+        poll_id = str(event.id)
+        path = self._archive_path(poll_id)
+        os.makedirs(self.archive_directory, exist_ok=True)
+        # We write to a temporary file first, so that the archive never contains a partially written poll.
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(gzip.compress(pickle.dumps(event)))
+        os.replace(f"{path}.tmp", path)
+        self._obsolete_archives.discard(poll_id)
+
+    def load_archived(self, poll_id: str) -> Optional[Event]:
+        path = self._archive_path(poll_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return pickle.loads(gzip.decompress(file.read()))
+
+    def restore_event(self, event: Event):
+        # The archive file is only removed once the restored poll has been persisted in the bot data.
+        self._obsolete_archives.add(str(event.id))
+
+    def archived_count(self) -> int:
+        return len(self._archived_ids())
+
+    def size(self) -> Optional[int]:
+        if not os.path.exists(self.filepath):
+            return None
+        return os.path.getsize(self.filepath)
+
+    def _snapshot(self) -> dict[str, EventSnapshot]:
+        """
+        Takes a snapshot of all polls, reusing the snapshots of the last flush for unchanged polls.
+        """
+        snapshots = {}
+        for poll_id, event in shared_context.events.items():
+            snapshot = self._snapshots.get(poll_id)
+            if snapshot is None or snapshot.version != event.version:
+                snapshot = EventSnapshot(event)
+            snapshots[poll_id] = snapshot
+        self._snapshots = snapshots
+        return snapshots
+
+    def _write(self, events: dict[str, EventSnapshot]):
+        """
+        Writes the given polls to the pickle file. Runs in a worker thread.
+        """
+        data = {
+            "conversations": {},
+            "user_data": {},
+            "chat_data": {},
+            "bot_data": {"events": events},
+            "callback_data": None,
+        }
+        # We write to a temporary file first, so that a crash never leaves behind a partially written file.
+        with open(f"{self.filepath}.tmp", "wb") as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.filepath}.tmp", self.filepath)
+
+    async def flush(self):
+        obsolete, self._obsolete_archives = self._obsolete_archives, set()
+        try:
+            await asyncio.to_thread(self._write, self._snapshot())
+        except Exception:
+            self._obsolete_archives |= obsolete
+            raise
+        for poll_id in obsolete:
+            if (path := self._archive_path(poll_id)) is not None and os.path.exists(path):
+                os.remove(path)
+
+
+class SQLiteStorage(Storage):
+    """
+    Stores polls and votes as separate rows in an SQLite database,
+    so that each change only writes the rows that actually changed.
+    If the database is empty, polls are migrated from an existing pickle file created by PickleStorage.
+
+    The database can also be shared by multiple processes (see --web-workers).
+    In that case, every change is committed immediately and recorded in a change log,
+    from which `sync` applies the changes made by other processes to the polls held in memory.
+
+    Archived polls stay in the database, but are marked as such, so that they are not loaded into memory.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            owner_id INTEGER NOT NULL,
+            days TEXT NOT NULL,
+            notify INTEGER NOT NULL,
+            anonymous INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            time_created TEXT NOT NULL,
+            archived INTEGER NOT NULL DEFAULT 0,
+            last_active TEXT
+        );
+        CREATE TABLE IF NOT EXISTS votes (
+            event_id TEXT NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            vote TEXT NOT NULL,
+            time_created TEXT NOT NULL,
+            PRIMARY KEY (event_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id TEXT NOT NULL,
+            user_id INTEGER
+        );
+    """
+    # The number of most recent changes kept in the change log. Processes which fall further behind reload all polls.
+    CHANGE_LOG_SIZE = 10_000
+    # The maximum number of polls read with a single query.
+    READ_CHUNK_SIZE = 500
+    # In shared mode, how often the views of a poll are recorded at most by each process, as each recording is a write.
+    ACTIVITY_INTERVAL = timedelta(minutes=10)
+
+    def __init__(self, filepath: str, migrate_from: Optional[str] = None, shared: bool = False):
+        """
+        :param filepath: The path to the SQLite database file. It will be created if it does not exist.
+        :param migrate_from: The path to a pickle file from which polls shall be migrated if the database is empty.
+        :param shared: Whether the database is shared with other processes which change it concurrently.
+        """
+        self.filepath = filepath
+        self.migrate_from = migrate_from
+        self.shared = shared
+        # The sequence number of the last change in the change log that has been applied.
+        self._last_change = 0
+        # The sequence numbers of changes made by this process after `_last_change`, which are already applied.
+        self._own_changes: set[int] = set()
+        # Changes whenever another process commits to the database.
+        self._data_version: Optional[int] = None
+        # Maps poll IDs to the time at which this process last recorded views of the poll.
+        self._recorded_views: dict[str, datetime] = {}
+        self._connection = sqlite3.connect(filepath)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        # Write-ahead logging makes single-row commits considerably cheaper.
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(events)")}
+        if "archived" not in columns:
+            # Databases created by older versions don't support archiving yet.
+            self._connection.execute(
+                "ALTER TABLE events ADD COLUMN archived INTEGER NOT NULL DEFAULT 0"
+            )
+        if "last_active" not in columns:
+            # Nor do they record when polls were last active.
+            self._connection.execute("ALTER TABLE events ADD COLUMN last_active TEXT")
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(changes)")}
+        if "user_id" not in columns:
+            # Change logs created by older versions only record which poll has changed.
+            self._connection.execute("ALTER TABLE changes ADD COLUMN user_id INTEGER")
+
+    async def load(self, app: Application):
+        await self.migrate()
+        self._data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        # We read within a single transaction, so that the polls match the state of the change log.
+        self._connection.execute("BEGIN")
+        try:
+            self._last_change = self._connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM changes"
+            ).fetchone()[0]
+            app.bot_data["events"] = self._read_events()
+        finally:
+            self._connection.commit()
+
+    def _read_events(
+        self, event_ids: Optional[list[str]] = None, archived: bool = False
+    ) -> dict[str, Event]:
+        """
+        Reads the given polls, along with their votes, from the database.
+        :param event_ids: The IDs of the polls to read, or None to read all polls.
+        :param archived: Whether to read archived polls instead of the ones that are not archived.
+        :return: A dictionary mapping the IDs of those polls that exist in the database to the polls.
+        """
+        if event_ids is None:
+            return self._read_event_chunk("", (), archived)
+
+        events = {}
+        for i in range(0, len(event_ids), self.READ_CHUNK_SIZE):
+            chunk = event_ids[i : i + self.READ_CHUNK_SIZE]
+            events.update(
+                self._read_event_chunk(f"IN ({', '.join('?' * len(chunk))})", chunk, archived)
+            )
+        return events
+
+    def _read_event_chunk(
+        self, condition: str, parameters: Sequence[str], archived: bool
+    ) -> dict[str, Event]:
+        """
+        Reads all polls whose ID matches the given condition, along with their votes, from the database.
+        :param condition: The SQL condition on the poll ID (e.g., "IN (?, ?)"), or an empty string to read all polls.
+        :param parameters: The parameters of the condition.
+        :param archived: Whether to read archived polls instead of the ones that are not archived.
+        :return: A dictionary mapping poll IDs to polls.
+        """
+        event_filter = f"AND id {condition}" if condition else ""
+        vote_filter = f"AND votes.event_id {condition}" if condition else ""
+        parameters = (archived, *parameters)
+        events = {}
+        votes: dict[str, list[EventVote]] = {}
+        for event_id, *vote_row in self._connection.execute(
+            "SELECT votes.event_id, user_id, user_name, vote, votes.time_created "
+            "FROM votes JOIN events ON events.id = votes.event_id "
+            f"WHERE archived = ? {vote_filter}",
+            parameters,
+        ):
+            votes.setdefault(event_id, []).append(self._vote_from_row(*vote_row))
+        for row in self._connection.execute(
+            "SELECT id, title, owner_id, days, notify, anonymous, description, time_created, last_active "
+            f"FROM events WHERE archived = ? {event_filter}",
+            parameters,
+        ):
+            event_id, title, owner_id, days, notify, anonymous, description, time_created, last_active = row
+            event = events[event_id] = Event(
+                title=title,
+                owner_id=owner_id,
+                days=json.loads(days),
+                notify=bool(notify),
+                anonymous=bool(anonymous),
+                votes=votes.get(event_id, []),
+                description=description,
+                id=uuid.UUID(event_id),
+                time_created=datetime.fromisoformat(time_created),
+            )
+            if last_active is not None:
+                event.last_active = max(event.last_active, datetime.fromisoformat(last_active))
+        return events
+
+    @staticmethod
+    def _vote_from_row(user_id: int, user_name: str, vote: str, time_created: str) -> EventVote:
+        return EventVote(
+            user_id=user_id,
+            user_name=user_name,
+            vote={k: VoteType(v) for k, v in json.loads(vote).items()},
+            time_created=datetime.fromisoformat(time_created),
+        )
+
+    def _read_votes(self, event_id: str, user_ids: list[int]) -> list[EventVote]:
+        """
+        Reads the votes of the given users on the given poll from the database.
+        :param event_id: The ID of the poll.
+        :param user_ids: The Telegram IDs of the users whose votes to read.
+        :return: Those of the votes that exist in the database.
+        """
+        votes = []
+        for i in range(0, len(user_ids), self.READ_CHUNK_SIZE):
+            chunk = user_ids[i : i + self.READ_CHUNK_SIZE]
+            votes += (
+                self._vote_from_row(*row)
+                for row in self._connection.execute(
+                    "SELECT user_id, user_name, vote, time_created FROM votes "
+                    f"WHERE event_id = ? AND user_id IN ({', '.join('?' * len(chunk))})",
+                    (event_id, *chunk),
+                )
+            )
+        return votes
+
+    async def migrate(self):
+        """
+        Migrates all polls from the pickle file given by `migrate_from` into the database, if it is empty.
+        """
+        if self._connection.execute("SELECT 1 FROM events LIMIT 1").fetchone() is not None:
+            return
+        if self.migrate_from is None or not os.path.exists(self.migrate_from):
+            return
+
+        bot_data = await PicklePersistence(self.migrate_from).get_bot_data()
+        events: dict[str, Event] = bot_data.get("events", {})
+        with self._connection:
+            for event in events.values():
+                self._insert_event(event)
+                for vote in event.votes:
+                    self._upsert_vote(event, vote)
+        logging.info(
+            f"Migrated {len(events)} polls from {self.migrate_from} to {self.filepath}."
+        )
+
+    def _insert_event(self, event: Event):
+        self._connection.execute(
+            "INSERT INTO events (id, title, owner_id, days, notify, anonymous, description, time_created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                str(event.id),
+                event.title,
+                event.owner_id,
+                json.dumps(event.days),
+                event.notify,
+                event.anonymous,
+                event.description,
+                event.time_created.isoformat(),
+            ),
+        )
+
+    def _upsert_vote(self, event: Event, vote: EventVote):
+        self._connection.execute(
+            "INSERT INTO votes (event_id, user_id, user_name, vote, time_created) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (event_id, user_id) DO UPDATE SET user_name = excluded.user_name, vote = excluded.vote",
+            (
+                str(event.id),
+                vote.user_id,
+                vote.user_name,
+                json.dumps(dict(vote.vote)),
+                vote.time_created.isoformat(),
+            ),
+        )
+
+    # The following methods run within the currently open transaction, which is committed on flush.
+    # In shared mode, they commit immediately instead.
+
+    def save_event(self, event: Event):
+        with self._change(str(event.id)):
+            self._insert_event(event)
+
+    def save_vote(self, event: Event, vote: EventVote):
+        with self._change(str(event.id), vote.user_id):
+            self._upsert_vote(event, vote)
+
+    def delete_event(self, poll_id: str):
+        with self._change(poll_id):
+            self._connection.execute("DELETE FROM events WHERE id = ?", (poll_id,))
+        self._recorded_views.pop(poll_id, None)
+
+    def archive_event(self, event: Event):
+        with self._change(str(event.id)):
+            self._connection.execute("UPDATE events SET archived = 1 WHERE id = ?", (str(event.id),))
+        self._recorded_views.pop(str(event.id), None)
+
+    def load_archived(self, poll_id: str) -> Optional[Event]:
+        return self._read_events([poll_id], archived=True).get(poll_id)
+
+    def restore_event(self, event: Event):
+        with self._change(str(event.id)):
+            # Other processes reload the poll, and must not archive it again right away.
+            self._connection.execute(
+                "UPDATE events SET archived = 0, last_active = ? WHERE id = ?",
+                (event.last_active.isoformat(), str(event.id)),
+            )
+
+    def archived_count(self) -> int:
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM events WHERE archived = 1"
+        ).fetchone()[0]
+
+    def record_activity(self, event: Event):
+        if not self.shared:
+            # Only this process holds the poll, so the time of its last activity is known anyway.
+            return
+        poll_id = str(event.id)
+        now = datetime.now()
+        if now - self._recorded_views.get(poll_id, datetime.min) < self.ACTIVITY_INTERVAL:
+            return
+        try:
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE events SET last_active = ? WHERE id = ?", (now.isoformat(), poll_id)
+                )
+        except sqlite3.OperationalError:
+            # Views are recorded on a best-effort basis, so we try again on the next view instead of failing.
+            logging.warning(f"Could not record the activity of poll {poll_id}.", exc_info=True)
+            return
+        self._recorded_views[poll_id] = now
+
+    def recorded_activity(self, poll_ids: list[str]) -> dict[str, datetime]:
+        activity = {}
+        for i in range(0, len(poll_ids), self.READ_CHUNK_SIZE):
+            chunk = poll_ids[i : i + self.READ_CHUNK_SIZE]
+            activity.update(
+                (poll_id, datetime.fromisoformat(last_active))
+                for poll_id, last_active in self._connection.execute(
+                    "SELECT id, last_active FROM events "
+                    f"WHERE last_active IS NOT NULL AND id IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+        return activity
+
+    @contextmanager
+    def _change(self, event_id: str, user_id: Optional[int] = None):
+        """
+        In shared mode, records the change made within this context in the change log and commits both.
+        Committing right away (without yielding to the event loop) ensures that the polls held in memory
+        never contain changes that other processes cannot see yet.
+        If the change fails (e.g., because another process has just deleted the poll), it is rolled back,
+        so that the connection doesn't keep holding the write lock.
+        :param event_id: The ID of the changed poll.
+        :param user_id: If only the vote of a single user has changed, the Telegram ID of that user.
+        Otherwise, other processes reload the whole poll.
+        """
+        if not self.shared:
+            yield
+            return
+        # Commits at the end of the block, or rolls back if anything within it fails.
+        with self._connection:
+            yield
+            seq = self._connection.execute(
+                "INSERT INTO changes (event_id, user_id) VALUES (?, ?)", (event_id, user_id)
+            ).lastrowid
+            if seq % self.CHANGE_LOG_SIZE == 0:
+                self._connection.execute(
+                    "DELETE FROM changes WHERE seq <= ?", (seq - self.CHANGE_LOG_SIZE,)
+                )
+        if seq == self._last_change + 1:
+            # No other process has changed anything since we last synchronized, so we are still up to date.
+            self._last_change = seq
+        else:
+            self._own_changes.add(seq)
+
+    def sync(self):
+        if not self.shared:
+            return
+        data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            # No other process has committed anything since the last sync.
+            return
+        self._data_version = data_version
+
+        # Maps the IDs of polls in memory of which only some votes have changed to the IDs of the voters.
+        changed_votes: dict[str, set[int]] = {}
+        self._connection.execute("BEGIN")
+        try:
+            first_change = self._connection.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            changes = self._connection.execute(
+                "SELECT seq, event_id, user_id FROM changes WHERE seq > ? ORDER BY seq",
+                (self._last_change,),
+            ).fetchall()
+            if first_change is not None and first_change > self._last_change + 1:
+                # Some changes we have not applied yet have been pruned from the change log.
+                events = self._read_events()
+                changed = set(events) | set(shared_context.events)
+            else:
+                foreign_changes = [
+                    (event_id, user_id)
+                    for seq, event_id, user_id in changes
+                    if seq not in self._own_changes
+                ]
+                # Polls are reloaded completely if they have been created, deleted, archived or restored.
+                changed = {
+                    event_id
+                    for event_id, user_id in foreign_changes
+                    if user_id is None or event_id not in shared_context.events
+                }
+                for event_id, user_id in foreign_changes:
+                    if event_id not in changed:
+                        changed_votes.setdefault(event_id, set()).add(user_id)
+                events = self._read_events(list(changed))
+                votes = {
+                    event_id: self._read_votes(event_id, list(user_ids))
+                    for event_id, user_ids in changed_votes.items()
+                }
+        finally:
+            self._connection.commit()
+
+        if changes:
+            self._last_change = changes[-1][0]
+            self._own_changes = {seq for seq in self._own_changes if seq > self._last_change}
+        for event_id in changed:
+            if event_id in events:
+                shared_context.replace_event(events[event_id])
+            elif event_id in shared_context.events:
+                shared_context.remove_event(event_id)
+        for event_id in changed_votes:
+            event = shared_context.events[event_id]
+            for vote in votes[event_id]:
+                if (existing := event.get_vote(vote.user_id)) is None:
+                    shared_context.add_vote(event, vote)
+                else:
+                    existing.user_name = vote.user_name
+                    event.update_vote(existing, vote.vote)
+        if changed or changed_votes:
+            logging.debug(
+                f"Synchronized {len(changed)} polls and the votes on {len(changed_votes)} polls "
+                "changed by other processes."
+            )
+
+    async def flush(self):
+        self._connection.commit()
+
+    def size(self) -> Optional[int]:
+        # Recent changes may only be contained in the write-ahead log.
+        return sum(
+            os.path.getsize(path)
+            for path in (self.filepath, f"{self.filepath}-wal")
+            if os.path.exists(path)
+        )
+
+    async def close(self):
+        self._connection.close()
+
+
+class PersistenceScheduler:
+    """
+    Coalesces changes to the stored polls into batches, so that a burst of changes only causes a few flushes.
+    A batch is flushed once it is older than `max_delay` seconds or contains `max_pending` changes,
+    whichever comes first. In strict mode, recording a change only returns once its batch has been flushed.
+    """
+
+    def __init__(self, storage: Storage, max_delay: float, max_pending: int, strict: bool):
+        """
+        :param storage: The storage backend to which changes are recorded.
+        :param max_delay: The maximum time (in seconds) a change may wait before it is flushed.
+        :param max_pending: The maximum number of changes that may wait before they are flushed.
+        :param strict: Whether recording a change should wait until the change has been flushed.
+        """
+        self.storage = storage
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.strict = strict
+        self._pending = 0
+        # Resolved once the current batch of changes has been flushed.
+        self._batch: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.Task] = None
+        # The task flushing full batches, if any. There is at most one, so that changes recorded while a flush
+        # is running don't each start another flush. (We also need to keep a reference to the task,
+        # as asyncio only keeps weak references to tasks.)
+        self._full_flush: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def save_event(self, event: Event):
+        """
+        Records a newly created poll. See Storage.save_event.
+        """
+        self.storage.save_event(event)
+        await self._changed()
+
+    async def save_vote(self, event: Event, vote: EventVote):
+        """
+        Records a vote that has been cast or edited. See Storage.save_vote.
+        """
+        self.storage.save_vote(event, vote)
+        await self._changed()
+
+    async def delete_event(self, poll_id: str):
+        """
+        Records that a poll has been deleted. See Storage.delete_event.
+        """
+        self.storage.delete_event(poll_id)
+        await self._changed()
+
+    async def archive_events(self, events: list[Event]):
+        """
+        Moves the given polls to the archive in a single batch. See Storage.archive_event.
+        """
+        for event in events:
+            self.storage.archive_event(event)
+        if events:
+            await self._changed()
+
+    async def restore_event(self, event: Event):
+        """
+        Records that an archived poll has been restored. See Storage.restore_event.
+        """
+        self.storage.restore_event(event)
+        await self._changed()
+
+    async def _changed(self):
+        """
+        Adds a change to the current batch and flushes the batch if necessary.
+        """
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_future()
+        batch = self._batch
+        self._pending += 1
+        if self._pending >= self.max_pending:
+            if self._full_flush is None:
+                self._full_flush = asyncio.create_task(self._flush_full())
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        if self.strict:
+            await asyncio.shield(batch)
+
+    async def _flush_full(self):
+        try:
+            # Enough changes for another full batch may have been recorded while flushing.
+            while self._pending >= self.max_pending:
+                await self.flush()
+        finally:
+            self._full_flush = None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Flushes all changes recorded so far. Changes recorded during the flush are put into the next batch.
+        """
+        async with self._lock:
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+            self._timer = None
+            batch, self._batch = self._batch, None
+            if batch is None:
+                return
+            num_changes, self._pending = self._pending, 0
+
+            start = time.perf_counter()
+            try:
+                await self.storage.flush()
+            except Exception as e:
+                logging.exception(f"Could not persist {num_changes} changes.")
+                batch.set_exception(e)
+                # Nobody may be waiting for this batch, so we need to retrieve the exception to avoid a warning.
+                batch.exception()
+            else:
+                logging.debug(f"Persisted {num_changes} changes.")
+                batch.set_result(None)
+            finally:
+                metrics.persistence_flush_duration.observe(time.perf_counter() - start)
+                metrics.persistence_flush_changes.observe(num_changes)
+
+    async def close(self):
+        """
+        Flushes all remaining changes. Called when the bot shuts down.
+        """
+        await self.flush()
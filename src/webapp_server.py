@@ -1,17 +1,65 @@
-import datetime
+import asyncio
+import hashlib
 import hmac
 import json
-import logging
+import math
 import os
-from typing import Optional
+import time
+from typing import Any, Awaitable, Callable, Optional
 from urllib.parse import parse_qs
 
-from quart import Quart, request, render_template
-from telegram.error import TelegramError
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, Response, g, request, render_template, url_for
+from telegram import Update
 
-from src.shared import shared_context, Event, EventVote, VoteType
+from src import metrics
+from src.assets import AssetStore
+from src.auth import AuthenticationError
+from src.cache import VersionedCache
+from src.compression import ENCODINGS, choose_encoding, compress
+from src.scoring import get_scores
+from src.shared import shared_context, run_cpu_bound, Event, EventVote, VoteType
 
 webapp = Quart(__name__, root_path=os.getcwd())
+# Requests to the API are small, so we reject larger bodies (with a 413 response) before even parsing them.
+# Besides this base size, run_webapp_server allows for the largest polls permitted by the arguments (e.g., --max-days).
+BASE_CONTENT_LENGTH = 64 * 1024
+webapp.config["MAX_CONTENT_LENGTH"] = BASE_CONTENT_LENGTH
+# Upper bounds on the size of each day and each character of the title or description in a request body.
+# Days take up at most `"YYYY-MM-DD":"maybe",` in a vote, and characters at most a JSON escape like `\uXXXX`.
+MAX_DAY_SIZE = 24
+MAX_CHARACTER_SIZE = 6
+# If metrics are served on a separate port, this app is used for it.
+metrics_app = Quart("metrics")
+# The task serving metrics_app, and the event that stops it.
+metrics_server: Optional[asyncio.Task] = None
+metrics_server_stop = asyncio.Event()
+# The task measuring the event loop lag, if metrics are enabled.
+lag_monitor: Optional[asyncio.Task] = None
+
+# Rendered pages and API responses along with their ETags, keyed by their name and poll ID.
+page_cache = VersionedCache(max_size=512)
+# The path at which Telegram sends updates to us in webhook mode.
+WEBHOOK_PATH = "/telegram/webhook"
+# The vote page and the results page (whose results are loaded separately) only depend on immutable attributes
+# of the poll, so they don't need to be re-rendered on new votes.
+IMMUTABLE_PAGE_VERSION = 0
+# The static files, served under fingerprinted URLs.
+assets = AssetStore(webapp.static_folder)
+# Fingerprinted assets never change, so clients may cache them for a year (the maximum recommended by RFC 9111).
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+# Responses smaller than this many bytes are not compressed, as this would hardly save anything.
+COMPRESSION_MIN_SIZE = 512
+# Only responses of these types are compressed. Static files are precompressed instead (see AssetStore).
+COMPRESSIBLE_MIMETYPES = {"text/html", "application/json", "text/plain"}
+# Compressed response bodies, keyed by the ETag of the response and the content encoding.
+# As the ETag identifies the content, the entries never become outdated, so they all have the same version.
+compressed_cache = VersionedCache(max_size=1024)
+COMPRESSED_BODY_VERSION = 0
+# The default and maximum number of voters returned per page by voters_data.
+VOTERS_PAGE_SIZE = 50
+MAX_VOTERS_PAGE_SIZE = 200
 
 
 @webapp.route("/poll", methods=["POST"])
@@ -25,11 +73,28 @@ async def create_poll():
     if (error := await check_validation(init_data)) is not None:
         return error
 
-    user_info = json.loads(init_data["user"][0])
+    user_info = g.user
+    args = shared_context.args
+    if not isinstance(data["title"], str) or not isinstance(data["description"], str):
+        return "The title and description must be strings.", 400
     # We convert the days to a dict (ordered on Python 3.7+) and back to a list to remove duplicates.
+    days = list(dict.fromkeys(data["days"]))
+    # Large polls make every vote and every rendering of the results more expensive, so we limit their size.
+    if len(days) > args.max_days:
+        return f"Polls may have at most {args.max_days} days.", 413
+    elif len(data["title"]) > args.max_title_length:
+        return f"Titles may be at most {args.max_title_length} characters long.", 413
+    elif len(data["description"]) > args.max_description_length:
+        return f"Descriptions may be at most {args.max_description_length} characters long.", 413
+    elif shared_context.owner_index.count(user_info["id"]) >= args.max_polls_per_owner:
+        return (
+            f"You may have at most {args.max_polls_per_owner} polls. Please delete some of your old polls first.",
+            429,
+        )
+
     event = Event(
         title=data["title"],
-        days=list(dict.fromkeys(data["days"])),
+        days=days,
         description=data["description"],
         notify=data["notification"],
         anonymous=data["anonymous"],
@@ -37,10 +102,10 @@ async def create_poll():
     )
     if "events" not in shared_context.telegram_app.bot_data:
         shared_context.telegram_app.bot_data["events"] = {}
-    shared_context.telegram_app.bot_data["events"][str(event.id)] = event
-    await shared_context.telegram_app.update_persistence()
+    shared_context.add_event(event)
+    await shared_context.persistence.save_event(event)
     url = f"https://t.me/{shared_context.telegram_app.bot.username}/vote?startapp={str(event.id)}"
-    await shared_context.telegram_app.bot.send_message(
+    shared_context.notifications.send(
         chat_id=user_info["id"],
         text=f'Created new poll "{data["title"]}"!\n\n'
         f"You can share the link to the poll with your friends:\n"
@@ -63,27 +128,25 @@ async def vote_poll():
     if (error := await check_validation(init_data)) is not None:
         return error
 
-    user_info = json.loads(init_data["user"][0])
-    if (
-        init_data["start_param"][0]
-        not in shared_context.telegram_app.bot_data["events"]
-    ):
+    user_info = g.user
+    # Another process may have deleted the poll while we were waiting for the request body,
+    # in which case we must not try to store the vote.
+    shared_context.storage.sync()
+    event = await shared_context.get_event(init_data["start_param"][0])
+    if event is None:
         # Most likely scenario: user voted on a poll that was deleted by the owner.
         return "This poll does not exist (anymore).", 404
-    event = shared_context.telegram_app.bot_data["events"][init_data["start_param"][0]]
     # Verify that the days match
     if event.days != list(data["days"].keys()):
         return "Days do not match with days of the event.", 400
 
     vote_days = {k: VoteType[v] for k, v in data["days"].items()}
     old_vote = None
-    event_vote = next(
-        filter(lambda x: x.user_id == int(user_info["id"]), event.votes), None
-    )
+    event_vote = event.get_vote(user_info["id"])
     if event_vote is not None:
         # User already voted, edit vote accordingly
         old_vote = event_vote.vote
-        event_vote.vote = vote_days
+        event.update_vote(event_vote, vote_days)
         exists = True
     else:
         user_name = "[Anonymous]"
@@ -94,25 +157,19 @@ async def vote_poll():
         event_vote = EventVote(
             user_id=user_info["id"], user_name=user_name, vote=vote_days
         )
-        event.votes.append(event_vote)
+        shared_context.add_vote(event, event_vote)
         exists = False
-    await shared_context.telegram_app.update_persistence()
+    await shared_context.persistence.save_vote(event, event_vote)
 
     # Only notify if the user has enabled notifications and if the vote has changed.
     if event.notify and old_vote != vote_days:
         vote_adjective = "Edited" if exists else "New"
         by_line = f" by {event_vote.user_name}" if not event.anonymous else ""
-        try:
-            await shared_context.telegram_app.bot.send_message(
-                chat_id=event.owner_id,
-                text=f'{vote_adjective} vote on your poll "{event.title}"{by_line}!\n\n'
-                "You can view the results of your polls at any time using /polls.",
-            )
-        except TelegramError:
-            # User probably blocked bot, this is fine. We should create a warning, though.
-            logging.warning(
-                f"User {event.owner_id} blocked bot, could not send notification."
-            )
+        shared_context.notifications.notify_vote(
+            event,
+            f'{vote_adjective} vote on your poll "{event.title}"{by_line}!\n\n'
+            "You can view the results of your polls at any time using /polls.",
+        )
 
     return "OK"
 
@@ -143,19 +200,16 @@ async def vote_results() -> dict[str, str | dict[str, VoteType]] | tuple[str, in
     if (error := await check_validation(init_data)) is not None:
         return error
 
-    user_info = json.loads(init_data["user"][0])
-    poll_id = init_data["start_param"][0]
-    if poll_id not in shared_context.telegram_app.bot_data["events"]:
+    user_info = g.user
+    poll = await shared_context.get_event(init_data["start_param"][0])
+    if poll is None:
         return "This poll does not exist (anymore).", 404
-    poll = shared_context.telegram_app.bot_data["events"][poll_id]
-    event_vote = next(
-        filter(lambda x: x.user_id == int(user_info["id"]), poll.votes), None
-    )
+    event_vote = poll.get_vote(user_info["id"])
     url = f"https://t.me/{shared_context.telegram_app.bot.username}/results?startapp={str(poll.id)}"
     if event_vote is None:
         return {"results": url, "votes": {}}
     else:
-        return {"results": url, "votes": event_vote.vote}
+        return {"results": url, "votes": dict(event_vote.vote)}
 
 
 @webapp.route("/poll", methods=["DELETE"])
@@ -169,68 +223,76 @@ async def delete_poll():
     if (error := await check_validation(init_data)) is not None:
         return error
 
-    user_info = json.loads(init_data["user"][0])
+    user_info = g.user
     poll_id = data["pollId"]
-    if poll_id not in shared_context.telegram_app.bot_data["events"]:
+    poll = await shared_context.get_event(poll_id)
+    if poll is None:
         return "This poll does not exist (anymore).", 404
-    poll = shared_context.telegram_app.bot_data["events"][poll_id]
     if poll.owner_id != user_info["id"]:
         return "You are not the owner of this poll.", 403
-    del shared_context.telegram_app.bot_data["events"][poll_id]
-    await shared_context.telegram_app.update_persistence()
-
-    try:
-        await shared_context.telegram_app.bot.send_message(
-            chat_id=user_info["id"], text=f'Deleted poll "{poll.title}".'
-        )
-    except TelegramError:
-        # User probably blocked bot, this is fine. We should create a warning, though.
-        logging.warning(
-            f'User {user_info["id"]} blocked bot, could not send notification.'
-        )
+    shared_context.remove_event(poll_id)
+    page_cache.invalidate(("vote", poll_id))
+    page_cache.invalidate(("results", poll_id))
+    page_cache.invalidate(("results-data", poll_id))
+    await shared_context.persistence.delete_event(poll_id)
+
+    shared_context.notifications.send(
+        chat_id=user_info["id"], text=f'Deleted poll "{poll.title}".'
+    )
     return "OK"
 
 
 async def check_validation(
     init_data: dict[str, list[str]]
-) -> Optional[tuple[str, int]]:
+) -> Optional[tuple[str, int] | tuple[str, int, dict[str, str]]]:
     """
-    Checks whether the data received by the Telegram webapp is valid.
-    If yes, returns None. If no, returns a tuple of the error message and the HTTP status code.
+    Checks whether the data received by the Telegram webapp is valid,
+    and whether the user who sent it is still within their rate limit (see --rate-limit).
+    If yes, returns None and makes the user who sent the data available as `g.user`.
+    If no, returns a tuple of the error message and the HTTP status code (and headers, if any).
 
     :param init_data: The data received by the Telegram webapp.
     :return: None if the data is valid, otherwise a tuple of the error message and the HTTP status code.
     """
-    timestamp = datetime.datetime.fromtimestamp(int(init_data["auth_date"][0]))
-    if not validate(init_data):
-        return "Invalid data was sent.", 400
-    elif (datetime.datetime.now() - timestamp) > datetime.timedelta(minutes=60):
-        return "Sent data is too old (more than 60 minutes old).", 400
+    try:
+        g.user = shared_context.authenticator.authenticate(init_data)
+    except AuthenticationError as e:
+        return e.message, 400
+
+    if shared_context.rate_limiter is not None:
+        retry_after = shared_context.rate_limiter.acquire(g.user["id"])
+        if retry_after > 0:
+            return (
+                "Too many requests. Please try again later.",
+                429,
+                {"Retry-After": str(math.ceil(retry_after))},
+            )
 
     return None
 
 
-def validate(init_data: dict[str, list[str]]) -> bool:
+@webapp.route(WEBHOOK_PATH, methods=["POST"])
+async def telegram_webhook():
     """
-    Cryptographically validates the data received by the Telegram webapp.
-    :param init_data: The data received by the Telegram webapp.
-    :return: Whether the data is valid.
+    Receives updates from Telegram if the bot runs in webhook mode, and passes them on to the bot.
+    Telegram authenticates itself using the secret token we passed when registering the webhook.
     """
-    # See https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
-    secret_key = hmac.digest(
-        b"WebAppData", shared_context.args.token.encode(), "sha256"
-    )
-    data_check_string = "\n".join(
-        list(
-            map(
-                lambda x: f"{x}={init_data[x][0]}",
-                filter(lambda x: x != "hash", sorted(key for key in init_data.keys())),
-            )
-        )
-    )
-    return hmac.digest(
-        secret_key, data_check_string.encode(), "sha256"
-    ) == bytes.fromhex(init_data["hash"][0])
+    if not shared_context.args.webhook:
+        return "Not Found", 404
+    secret_token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret_token, shared_context.args.webhook_secret):
+        return "Invalid secret token.", 403
+
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        # Update.de_json would return None here, which the bot can't process.
+        return "Invalid update.", 400
+    try:
+        update = Update.de_json(data, shared_context.telegram_app.bot)
+    except (KeyError, TypeError, ValueError):
+        return "Invalid update.", 400
+    await shared_context.telegram_app.update_queue.put(update)
+    return "OK"
 
 
 @webapp.route("/create")
@@ -238,7 +300,11 @@ async def create():
     """
     Renders the create page.
     """
-    return await render_template("create.html")
+    return await render_template(
+        "create.html",
+        max_title_length=shared_context.args.max_title_length,
+        max_description_length=shared_context.args.max_description_length,
+    )
 
 
 @webapp.route("/vote")
@@ -249,13 +315,12 @@ async def vote():
     poll_id = request.args.get("tgWebAppStartParam")
     if poll_id is None:
         return await render_template("error.html", error="No poll ID supplied."), 400
-    elif poll_id not in shared_context.telegram_app.bot_data["events"]:
+    elif (poll := await shared_context.get_event(poll_id)) is None:
         return (
             await render_template("error.html", error="Poll does not exist (anymore)."),
             404,
         )
-    poll = shared_context.telegram_app.bot_data["events"][poll_id]
-    return await render_template("vote.html", poll=poll)
+    return await render_cached(("vote", poll_id), IMMUTABLE_PAGE_VERSION, "vote.html", poll=poll)
 
 
 @webapp.route("/results")
@@ -269,20 +334,223 @@ async def results():
 
     if poll_id is None:
         return await render_template("error.html", error="No poll ID supplied."), 400
-    elif poll_id not in shared_context.telegram_app.bot_data["events"]:
+    elif (poll := await shared_context.get_event(poll_id)) is None:
         return (
             await render_template("error.html", error="Poll does not exist (anymore)."),
             404,
         )
-    poll = shared_context.telegram_app.bot_data["events"][poll_id]
-    return await render_template(
+    # The results themselves are loaded by results.js (see results_data), so the page doesn't change on new votes.
+    return await render_cached(
+        ("results", poll_id),
+        IMMUTABLE_PAGE_VERSION,
         "results.html",
         poll=poll,
-        best_days=poll.best_days(),
         bot_username=shared_context.telegram_app.bot.username,
     )
 
 
+@webapp.route("/poll/results", methods=["GET"])
+async def results_data():
+    """
+    Returns the results of the poll given by the URL parameter `poll_id` in a compact JSON format.
+    Intended to be called by the results page's JavaScript code.
+
+    The returned JSON object has the following structure::
+
+        {
+            "version": 3,
+            "days": ["day1", "day2"],
+            "counts": {"yes": [2, 0], "maybe": [0, 1], "no": [0, 1]},
+            "best_days": ["day1"],
+            "weights": {"yes": 1.0, "maybe": 0.5, "no": 0.0},
+            "scores": [2.0, 0.5],
+            "ranks": [1, 2],
+            "windows": {"2": [{"days": ["day1", "day2"], "score": 2.5, "available": 1}]}
+        }
+
+    The counts, scores and ranks are given in the order of the days (see src/scoring.py for how they are computed).
+    The best windows of consecutive days are given per window length, best first.
+    The voters are loaded separately (see voters_data), only once the user wants to see them.
+    """
+    poll_id = request.args.get("poll_id")
+    if poll_id is None:
+        return "No poll ID supplied.", 400
+    elif (poll := await shared_context.get_event(poll_id)) is None:
+        return "This poll does not exist (anymore).", 404
+    return await respond_cached(
+        ("results-data", poll_id),
+        poll.version,
+        lambda: results_json(poll),
+        mimetype="application/json",
+    )
+
+
+async def results_json(poll: Event) -> str:
+    """
+    Serializes the results of the given poll as returned by `results_data`.
+    :param poll: The poll whose results to serialize.
+    :return: The JSON-encoded results.
+    """
+    best_days = poll.best_days()
+    scores = await get_scores(poll)
+    data: dict[str, Any] = {
+        "version": poll.version,
+        "days": poll.days,
+        "counts": {
+            vote_type: [poll.num_votes(day, vote_type) for day in poll.days]
+            for vote_type in VoteType
+        },
+        "best_days": [day for day in poll.days if day in best_days],
+        "weights": dict(zip(("yes", "maybe", "no"), shared_context.args.score_weights)),
+        "scores": [scores.scores[day] for day in poll.days],
+        "ranks": [scores.ranks[day] for day in poll.days],
+        "windows": {
+            length: [
+                {"days": window.days, "score": window.score, "available": window.available}
+                for window in windows
+            ]
+            for length, windows in scores.windows.items()
+        },
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+@webapp.route("/poll/voters", methods=["GET"])
+async def voters_data():
+    """
+    Returns a page of the voters who cast a vote of the given type on the given day of a non-anonymous poll.
+    The poll, day, and vote type are given by the URL parameters `poll_id`, `day`, and `type`,
+    while the page is selected by the optional URL parameters `offset` and `limit`.
+    Intended to be called by the results page's JavaScript code whenever a group of votes is expanded.
+
+    The returned JSON object has the following structure::
+
+        {
+            "voters": [
+                {"name": "Jane Doe", "time": "2024-01-01T12:00:00"},
+                {"name": "John Doe", "time": "2024-01-01T13:00:00"}
+            ],
+            "total": 3,
+            "next_offset": 2
+        }
+
+    If there are no further voters, `next_offset` is null.
+    """
+    poll_id = request.args.get("poll_id")
+    if poll_id is None:
+        return "No poll ID supplied.", 400
+    elif (poll := await shared_context.get_event(poll_id)) is None:
+        return "This poll does not exist (anymore).", 404
+    if poll.anonymous:
+        return "This poll is anonymous.", 403
+
+    day = request.args.get("day")
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", VOTERS_PAGE_SIZE, type=int)
+    try:
+        vote_type = VoteType(request.args.get("type"))
+    except ValueError:
+        return "Invalid vote type.", 400
+    if day not in poll.days:
+        return "This day is not part of the poll.", 400
+    elif offset < 0 or not 0 < limit <= MAX_VOTERS_PAGE_SIZE:
+        return "Invalid page.", 400
+
+    votes = await run_cpu_bound(len(poll.votes), poll.day_votes, day, vote_type)
+    next_offset = offset + limit if offset + limit < len(votes) else None
+    return {
+        "voters": [
+            {"name": vote.user_name, "time": vote.time_created.isoformat(timespec="seconds")}
+            for vote in votes[offset : offset + limit]
+        ],
+        "total": len(votes),
+        "next_offset": next_offset,
+    }
+
+
+async def render_cached(key: tuple[str, str], version: int, template: str, **context) -> Response:
+    """
+    Renders the given template, unless it has already been rendered for the given key and version.
+    See `respond_cached` for details.
+
+    :param key: The key under which to cache the rendered page (the page name and the poll ID).
+    :param version: The version of the poll the page is rendered from.
+    :param template: The name of the template to render.
+    :param context: The variables to pass to the template.
+    :return: The response containing the rendered page, or a 304 response.
+    """
+    return await respond_cached(key, version, lambda: render_template(template, **context))
+
+
+async def respond_cached(
+    key: tuple[str, str],
+    version: int,
+    produce: Callable[[], Awaitable[str]],
+    mimetype: str = "text/html",
+) -> Response:
+    """
+    Responds with the body returned by `produce`, unless it has already been produced for the given key and version.
+    The response carries a strong ETag, so that clients can revalidate their cached copy of the body.
+    If the client's copy is still up-to-date (i.e., its If-None-Match header contains the ETag),
+    an empty 304 response is returned instead of the body.
+
+    :param key: The key under which to cache the body (its name and the poll ID).
+    :param version: The version of the poll the body is produced from.
+    :param produce: Produces the body.
+    :param mimetype: The MIME type of the body.
+    :return: The response containing the body, or a 304 response.
+    """
+    if (page := page_cache.get(key, version)) is None:
+        body = await produce()
+        page = (body, hashlib.sha256(body.encode()).hexdigest())
+        page_cache.put(key, version, page)
+
+    body, etag = page
+    # The ETag may have been made weak by compress_response, and If-None-Match uses weak comparison anyway.
+    if request.if_none_match.contains_weak(etag):
+        response = Response("", status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    # Clients may cache the page, but must revalidate it every time.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@webapp.route("/assets/<path:path>")
+async def asset(path: str):
+    """
+    Serves a static file under its fingerprinted path (see AssetStore), compressed if the client supports it.
+    As the path changes whenever the file changes, clients may cache the response indefinitely.
+    """
+    if (static_file := assets.get(path)) is None:
+        return "Not Found", 404
+
+    encoding = choose_encoding(request.accept_encodings, static_file.variants)
+    if request.if_none_match.contains_weak(static_file.etag):
+        response = Response("", status=304)
+    elif encoding is not None:
+        response = Response(static_file.variants[encoding], mimetype=static_file.mimetype)
+        response.content_encoding = encoding
+    else:
+        response = Response(static_file.content, mimetype=static_file.mimetype)
+    response.vary.add("Accept-Encoding")
+    # As for compressed dynamic responses, the ETag of a compressed variant is weak (see compress_response).
+    response.set_etag(static_file.etag, weak=encoding is not None)
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
+
+
+@webapp.template_global()
+def asset_url(path: str) -> str:
+    """
+    Returns the fingerprinted URL of the given static file. Intended to be used in templates.
+    :param path: The path of the file within the static directory (e.g., `js/common.js`).
+    :return: The fingerprinted URL of the file.
+    """
+    return url_for("asset", path=assets.fingerprinted_path(path))
+
+
 @webapp.route("/")
 async def index():
     """
@@ -292,6 +560,126 @@ async def index():
     return "The Dayfinder WebApp is hosted here. There's nothing on this page, though."
 
 
+@webapp.route("/metrics")
+async def metrics_endpoint():
+    """
+    Returns all metrics in the Prometheus text format,
+    if metrics are enabled and not served on a separate port.
+    """
+    if not shared_context.args.enable_metrics or shared_context.args.metrics_port is not None:
+        return "Not Found", 404
+    return expose_metrics()
+
+
+@metrics_app.route("/metrics")
+def expose_metrics():
+    """
+    Returns all metrics in the Prometheus text format.
+    """
+    return metrics.registry.expose(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+@webapp.before_request
+async def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@webapp.before_request
+async def sync_storage():
+    """
+    Applies changes made by other processes (see --web-workers) before handling the request,
+    so that users always see their own votes, no matter which process handled the vote.
+    """
+    shared_context.storage.sync()
+
+
+@webapp.after_request
+async def record_request_metrics(response):
+    if "request_start" in g:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.http_request_duration.observe(
+            time.perf_counter() - g.request_start,
+            request.method,
+            route,
+            str(response.status_code),
+        )
+    return response
+
+
+@webapp.before_serving
+async def load_assets():
+    """
+    Reads and compresses the static files, so that this doesn't need to happen on the first request.
+    """
+    assets.load()
+
+
+@webapp.before_serving
+async def start_metrics_server():
+    """
+    Starts measuring the event loop lag if metrics are enabled,
+    and starts serving the metrics on a separate port, if one has been specified.
+    """
+    global lag_monitor, metrics_server
+    if shared_context.args.enable_metrics:
+        lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
+    if shared_context.args.metrics_port is None:
+        return
+    config = Config()
+    config.bind = [f"{shared_context.args.metrics_host}:{shared_context.args.metrics_port}"]
+    # The main server handles the signals, and stops this server in stop_metrics_server().
+    metrics_server = asyncio.create_task(
+        serve(metrics_app, config, shutdown_trigger=metrics_server_stop.wait)
+    )
+
+
+@webapp.after_serving
+async def stop_metrics_server():
+    """
+    Stops the metrics server and the event loop lag measurement, if they are running.
+    """
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+    if metrics_server is None:
+        return
+    metrics_server_stop.set()
+    await metrics_server
+
+
+@webapp.after_request
+async def compress_response(response: Response) -> Response:
+    """
+    Compresses the response if it is worth compressing and the client supports it.
+    Responses carrying an ETag (i.e., the cached pages and API responses, see respond_cached)
+    are only compressed once per ETag and encoding.
+    """
+    if (
+        response.status_code != 200
+        or response.content_encoding is not None
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or not isinstance(response.response, response.data_body_class)
+        or (response.content_length or 0) < COMPRESSION_MIN_SIZE
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if (encoding := choose_encoding(request.accept_encodings, ENCODINGS)) is None:
+        return response
+    etag, _ = response.get_etag()
+    if etag is None:
+        body = compress(await response.get_data(), encoding, fast=True)
+    elif (body := compressed_cache.get((etag, encoding), COMPRESSED_BODY_VERSION)) is None:
+        body = compress(await response.get_data(), encoding, fast=True)
+        compressed_cache.put((etag, encoding), COMPRESSED_BODY_VERSION, body)
+    response.set_data(body)
+    response.content_encoding = encoding
+    if etag is not None:
+        # The compressed body is not byte-for-byte identical to the uncompressed one,
+        # so the ETag must be weak (as done by, e.g., nginx).
+        response.set_etag(etag, weak=True)
+    return response
+
+
 @webapp.after_request
 async def add_header(response):
     # We need to allow the webapp to be embedded within the Telegram webapp.
@@ -299,11 +687,34 @@ async def add_header(response):
     return response
 
 
-async def run_webapp_server():
-    await webapp.run_task(
-        host=shared_context.args.web_host,
-        port=shared_context.args.web_port,
-        debug=shared_context.args.debug,
-        certfile=shared_context.args.web_certfile,
-        keyfile=shared_context.args.web_keyfile,
+async def run_webapp_server(socket_fd: Optional[int] = None):
+    """
+    Runs the web server until it is stopped.
+    :param socket_fd: The file descriptor of an already bound socket to serve on, as used by worker processes.
+    If this is None, the web server binds to the host and port given in the arguments.
+    """
+    args = shared_context.args
+    webapp.config["MAX_CONTENT_LENGTH"] = BASE_CONTENT_LENGTH + (
+        args.max_days * MAX_DAY_SIZE
+        + (args.max_title_length + args.max_description_length) * MAX_CHARACTER_SIZE
     )
+    if socket_fd is None:
+        await webapp.run_task(
+            host=shared_context.args.web_host,
+            port=shared_context.args.web_port,
+            debug=shared_context.args.debug,
+            certfile=shared_context.args.web_certfile,
+            keyfile=shared_context.args.web_keyfile,
+        )
+        return
+
+    # This mirrors the configuration used by run_task.
+    config = Config()
+    config.access_log_format = "%(h)s %(r)s %(s)s %(b)s %(D)s"
+    config.accesslog = "-"
+    config.errorlog = "-"
+    config.bind = [f"fd://{socket_fd}"]
+    config.certfile = shared_context.args.web_certfile
+    config.keyfile = shared_context.args.web_keyfile
+    webapp.debug = shared_context.args.debug
+    await serve(webapp, config)
@@ -6,12 +6,29 @@ let expandButton;
 // Contains the collapse elements.
 let collapseElements;
 
-window.addEventListener('load', function () {
+// The classes of the badges displaying the voters, per vote type.
+const BADGE_CLASSES = {yes: "bg-success", maybe: "bg-secondary", no: "bg-danger"};
+
+// When expanding all elements, the voters of this many elements are loaded at once.
+const EXPAND_BATCH_SIZE = 6;
+
+// Maps each group of votes (i.e., accordion item) to the offset of the next page of voters to load.
+// Once all voters of a group have been loaded, the offset is null.
+const nextOffsets = new Map();
+
+// Maps each group of votes to the promise of the page of voters currently being loaded for it.
+const loadingVoters = new Map();
+
+window.addEventListener('load', async function () {
 
     if (Telegram.WebApp.colorScheme === "dark") {
         document.body.classList.add("dark");
     }
 
+    if (!await loadResults()) {
+        return;
+    }
+
     // We want to display all dates in the user's locale.
     replaceDateElements();
 
@@ -28,28 +45,212 @@ window.addEventListener('load', function () {
     const isAnonymous = document.getElementById("isAnonymous").value === "True";
     if (!isAnonymous) {
         // We only want non-empty groups to be expandable.
-        collapseElements = Array.from(document.getElementsByClassName('collapse'))
-            .filter(element => element.getElementsByClassName('badge').length > 0);
+        collapseElements = Array.from(document.querySelectorAll(".accordion-item"))
+            .filter(item => !item.querySelector(".accordion-button").disabled)
+            .map(item => item.querySelector(".collapse"));
         expandButton = document.getElementById("expandButton");
         expandButton.classList.remove("d-none");
         expandButton.classList.add("d-block");
         expandButton.onclick = expandCollapseAll;
-
-        // We initialize all badges to display the vote's date in the user's locale.
-        const popoverTriggerList = document.querySelectorAll('[data-bs-toggle="popover"]')
-        for (const popoverTriggerEl of popoverTriggerList) {
-            popoverTriggerEl.dataset.bsContent = new Date(popoverTriggerEl.dataset.bsContent).toLocaleString();
-            new bootstrap.Popover(popoverTriggerEl, {trigger: "focus"});
-        }
     }
 
     Telegram.WebApp.expand();
 });
 
+/**
+ * Loads the results of the poll from the server and displays them.
+ * @returns {Promise<boolean>} Whether the results could be loaded.
+ */
+async function loadResults() {
+    const pollId = document.getElementById("pollId").value;
+    // If we have a cached copy of the results, the server will tell us whether it is still up-to-date.
+    const response = await fetch("/poll/results?poll_id=" + encodeURIComponent(pollId));
+    if (!response.ok) {
+        const text = await response.text();
+        showAlert("An error occurred while loading the results: " + text, Telegram.WebApp.close);
+        return false;
+    }
+
+    const results = await response.json();
+    const isAnonymous = document.getElementById("isAnonymous").value === "True";
+    const bestDays = new Set(results["best_days"]);
+    const dayTemplate = document.getElementById("dayTemplate");
+    const list = document.getElementById("selectedDaysList");
+    results["days"].forEach((day, index) => {
+        const dayElement = dayTemplate.content.firstElementChild.cloneNode(true);
+        dayElement.dataset.day = day;
+        if (bestDays.has(day)) {
+            dayElement.classList.add("best-option");
+        }
+        dayElement.querySelector(".original-date").textContent = day;
+        dayElement.querySelector(".formatted-date").textContent = day;
+        dayElement.querySelector(".day-score").textContent =
+            `#${results["ranks"][index]} · score ${formatScore(results["scores"][index])}`;
+        const accordion = dayElement.querySelector(".accordion");
+        accordion.id = `votes-${day}`;
+        for (const item of accordion.getElementsByClassName("accordion-item")) {
+            const voteType = item.dataset.voteType;
+            const count = results["counts"][voteType][index];
+            fillVoteGroup(item, day, count, isAnonymous);
+        }
+        list.appendChild(dayElement);
+    });
+
+    if (bestDays.size > 0) {
+        document.getElementById("bestOptionHelp").classList.remove("d-none");
+    }
+    const weights = results["weights"];
+    document.getElementById("scoreHelp").textContent = `Days are ranked by their score, for which yes votes count `
+        + `${formatScore(weights["yes"])}, maybe votes ${formatScore(weights["maybe"])} `
+        + `and no votes ${formatScore(weights["no"])}.`;
+    fillWindows(results["windows"]);
+    return true;
+}
+
+/**
+ * Displays the best windows of consecutive days, leaving out those without any score.
+ * @param windows The best windows per window length, as returned by the server.
+ */
+function fillWindows(windows) {
+    const list = document.getElementById("windowsList");
+    for (const [length, lengthWindows] of Object.entries(windows)) {
+        for (const dayWindow of lengthWindows.filter(dayWindow => dayWindow["score"] > 0)) {
+            const item = document.createElement("li");
+            item.className = "list-group-item ps-0 pe-0";
+            const first = new Date(dayWindow["days"][0]).toLocaleDateString();
+            const last = new Date(dayWindow["days"][dayWindow["days"].length - 1]).toLocaleDateString();
+            item.textContent = `${length} days: ${first} – ${last}`;
+            const details = document.createElement("div");
+            details.className = "small day-score";
+            details.textContent = `Score ${formatScore(dayWindow["score"])}, `
+                + `${dayWindow["available"]} can make all of them`;
+            item.appendChild(details);
+            list.appendChild(item);
+        }
+    }
+    if (list.childElementCount > 0) {
+        document.getElementById("windowsSection").classList.remove("d-none");
+    }
+}
+
+/**
+ * Formats the given score for display, with at most two decimal places.
+ * @param score The score to format.
+ * @returns {string} The formatted score.
+ */
+function formatScore(score) {
+    return Number(score.toFixed(2)).toString();
+}
+
+/**
+ * Fills in the accordion item showing the votes of a single type on a single day.
+ * The voters themselves are only loaded once the item is expanded.
+ * @param item The accordion item to fill in.
+ * @param day The day of the votes.
+ * @param count The number of votes.
+ * @param isAnonymous Whether the poll is anonymous, in which case the voters can't be shown.
+ */
+function fillVoteGroup(item, day, count, isAnonymous) {
+    const voteType = item.dataset.voteType;
+    const collapseId = `${voteType}-${day}`;
+    item.dataset.day = day;
+    const button = item.querySelector(".accordion-button");
+    button.dataset.bsTarget = "#" + collapseId;
+    button.setAttribute("aria-controls", collapseId);
+    button.disabled = isAnonymous || count === 0;
+    item.querySelector(".vote-count").textContent = count;
+
+    const collapse = item.querySelector(".accordion-collapse");
+    collapse.id = collapseId;
+    collapse.setAttribute("aria-labelledby", collapseId);
+    collapse.dataset.bsParent = `#votes-${day}`;
+    collapse.dataset.parent = `#votes-${day}`;
+    if (!button.disabled) {
+        collapse.addEventListener("show.bs.collapse", () => loadVoters(item));
+    }
+}
+
+/**
+ * Loads the next page of voters of the given group of votes, unless all of them have been loaded already.
+ * @param item The accordion item showing the group of votes.
+ * @returns {Promise<void>} Resolved once the page has been loaded.
+ */
+function loadVoters(item) {
+    if (!loadingVoters.has(item)) {
+        loadingVoters.set(item, fetchVoters(item).finally(() => loadingVoters.delete(item)));
+    }
+    return loadingVoters.get(item);
+}
+
+/**
+ * Fetches the next page of voters of the given group of votes from the server and displays them.
+ * @param item The accordion item showing the group of votes.
+ */
+async function fetchVoters(item) {
+    const offset = nextOffsets.has(item) ? nextOffsets.get(item) : 0;
+    if (offset === null) {
+        return;
+    }
+
+    const params = new URLSearchParams({
+        poll_id: document.getElementById("pollId").value,
+        day: item.dataset.day,
+        type: item.dataset.voteType,
+        offset: offset,
+    });
+    const response = await fetch("/poll/voters?" + params);
+    if (!response.ok) {
+        const text = await response.text();
+        showAlert("An error occurred while loading the votes: " + text, () => {});
+        return;
+    }
+
+    const data = await response.json();
+    const body = item.querySelector(".accordion-body");
+    let moreButton = body.querySelector(".more-voters");
+    for (const voter of data["voters"]) {
+        const badge = document.createElement("a");
+        badge.className = `badge ${BADGE_CLASSES[item.dataset.voteType]} text-nowrap`;
+        badge.tabIndex = 0;
+        badge.dataset.bsTrigger = "focus";
+        badge.dataset.bsPlacement = "top";
+        badge.dataset.bsToggle = "popover";
+        // We display the vote's date in the user's locale.
+        badge.dataset.bsContent = new Date(voter["time"]).toLocaleString();
+        badge.textContent = truncate(voter["name"], 33);
+        body.insertBefore(badge, moreButton);
+        body.insertBefore(document.createTextNode(" "), moreButton);
+        new bootstrap.Popover(badge, {trigger: "focus"});
+    }
+
+    nextOffsets.set(item, data["next_offset"]);
+    if (data["next_offset"] === null) {
+        moreButton?.remove();
+    } else if (moreButton === null) {
+        moreButton = document.createElement("button");
+        moreButton.type = "button";
+        moreButton.className = "btn btn-link btn-sm more-voters";
+        moreButton.textContent = "Show more";
+        moreButton.onclick = () => loadVoters(item);
+        body.append(moreButton);
+    }
+}
+
+/**
+ * Truncates the given text to the given length, indicating the truncation by an ellipsis.
+ * @param text The text to truncate.
+ * @param length The maximum length of the text.
+ * @returns {string} The truncated text.
+ */
+function truncate(text, length) {
+    return text.length <= length ? text : text.slice(0, length - 3) + "...";
+}
+
 /**
  * Expands or collapses all elements, depending on the current state.
+ * When expanding, the voters are loaded in batches, so that we don't send a request for every group at once.
  */
-function expandCollapseAll() {
+async function expandCollapseAll() {
     const collapse = expandButton.textContent === "Expand all";
     if (collapse) {
         expandButton.textContent = "Collapse all";
@@ -60,15 +261,26 @@ function expandCollapseAll() {
     // When expanding all elements, we want to allow expanding multiple accordions per group.
     // Therefore, we remove the data-bs-parent attribute first.
     // Then, we can actually expand or collapse all elements.
-    for (const element of collapseElements) {
-        // NOTE: The bootstrap.Collapse element must be constructed *after* bsParent has been modified.
-        if (collapse) {
-            delete element.dataset.bsParent;
-            new bootstrap.Collapse(element, {toggle: false}).show();
-        } else {
+    // NOTE: The bootstrap.Collapse element must be constructed *after* bsParent has been modified.
+    if (!collapse) {
+        for (const element of collapseElements) {
             element.dataset.bsParent = element.dataset.parent;
             new bootstrap.Collapse(element, {toggle: false}).hide();
         }
+        return;
+    }
+    for (let i = 0; i < collapseElements.length; i += EXPAND_BATCH_SIZE) {
+        if (expandButton.textContent === "Expand all") {
+            // The user has collapsed all elements in the meantime.
+            return;
+        }
+        const batch = collapseElements.slice(i, i + EXPAND_BATCH_SIZE);
+        for (const element of batch) {
+            delete element.dataset.bsParent;
+            // Showing the element starts loading its voters.
+            new bootstrap.Collapse(element, {toggle: false}).show();
+        }
+        await Promise.all(batch.map(element => loadVoters(element.closest(".accordion-item"))));
     }
 }
 